@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import sys, os, time
-from columns import name as col_name, index as col_index
+from columns import name as col_name, index as col_index, position as col_position
 
 if sys.platform == 'win32':
     #This is required in order to make pyuno usable with the default python interpreter under windows
@@ -32,14 +32,17 @@ if sys.platform == 'win32':
         paths += install_folder + path
     os.environ['PATH'] =  paths+ os.environ['PATH']
 
-import uno, re, zipfile, types, inspect
+import uno, unohelper, re, zipfile, types, inspect, threading
 from datetime import datetime, timedelta
+from collections import deque
 
 # http://codesnippets.services.openoffice.org/Office/Office.MessageBoxWithTheUNOBasedToolkit.snip
 from com.sun.star.awt import WindowDescriptor
 from com.sun.star.awt.WindowClass import MODALTOP
 from com.sun.star.awt.VclWindowPeerAttribute import OK
 
+from com.sun.star.util import XChangesListener, XModifyListener
+
 class OODoc(object):
     """
     Interacts with any OpenOffice.org instance, not necessarily a Spreadsheet.
@@ -51,6 +54,16 @@ class OODoc(object):
     _model = None
     _dispatcher = None
     _cached = False
+    # Sheet objects of the document by name, see OOSheet.clear_sheet_cache()
+    _sheets = {}
+    # Number format information of the document, see OOSheet.basedate and OOSheet._set_date_format()
+    _basedate = None
+    _date_format = None
+    _format_types = {}
+    # Read-through cache of cells, see OOSheet.enable_cache()
+    _cell_cache = None
+    # Feed of changes in document, see OOSheet.watch_changes()
+    _change_feed = None
 
     def __init__(self):
         if not OODoc._dispatcher:
@@ -63,6 +76,12 @@ class OODoc(object):
         OODoc._context = self.context = self.get_context()
         OODoc._model = self.model = self.get_model()
         OODoc._dispatcher = self.dispatcher = self.get_dispatcher()
+        OODoc._sheets = {}
+        OODoc._basedate = None
+        OODoc._date_format = None
+        OODoc._format_types = {}
+        OODoc._cell_cache = None
+        OODoc._change_feed = None
 
     def load_cache(self):
         self.macro_environment = OODoc._macro_environment
@@ -166,6 +185,10 @@ class OODoc(object):
         self.dispatcher.executeDispatch(self.model.getCurrentController(),
                                         '.uno:%s' % cmd, '', 0, args)
 
+        # Any event but moving the cursor may change cells
+        if OODoc._cell_cache is not None and cmd != 'GoToCell':
+            OODoc._cell_cache.invalidate()
+
     def alert(self, msg, title = u'Alert'):
         """Opens an alert window with a message and title, and requires user to click 'Ok'"""
         parentWin = self.model.CurrentController.Frame.ContainerWindow
@@ -187,6 +210,17 @@ class OODoc(object):
 
         box.execute()
 
+    def bulk(self, undo = True):
+        """
+        Returns an OOBulkEdit object, to be used with the "with" statement around a batch of edits.
+        While inside it, screen is not repainted and formulas are not recalculated. If "undo" is True,
+        all edits are grouped as a single undo action, otherwise they're not recorded for undo at all.
+
+        >>> with OODoc().bulk():
+        ...     S('a1:a10000').value = 1
+        """
+        return OOBulkEdit(self.model, undo)
+
     def undo(self):
         """Undo the last action"""
         self.dispatch('.uno:Undo')
@@ -219,12 +253,200 @@ class OODoc(object):
         """Closes the OpenOffice.org instance"""
         self.dispatch('Quit')
 
+class _BoundedCache(object):
+    """
+    A dictionary-like cache holding at most "size" items. When full, all items are discarded,
+    which is cheap and good enough for memoizing. A plain dict is used, as OrderedDict is not
+    available in Python 2.6.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.items = {}
+
+    def get(self, key, default = None):
+        return self.items.get(key, default)
+
+    def put(self, key, value):
+        if len(self.items) >= self.size and key not in self.items:
+            self.items.clear()
+        self.items[key] = value
+
+    def clear(self):
+        self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+class _CellCache(object):
+    """
+    Read-through cache of cells, see OOSheet.enable_cache().
+
+    Data is kept in tiles of one column and "tile_rows" rows, filled by block reads with
+    getDataArray() and getFormulaArray() and dropped when any cell in them is written.
+    Strings of cells with numbers depend on formatting, so they are fetched and kept one by one.
+
+    Tiles with formulas may change when any other cell is written, so they're dropped on every write.
+
+    Each read served without calling LibreOffice counts as a hit, the others as misses.
+
+    Changes notified by LibreOffice, see OOChangeFeed, may come from another thread while
+    the cache is being read, so they're queued by invalidate_later() and applied on next read.
+    """
+
+    tile_rows = 64
+
+    DATA, FORMULAS, STRINGS = 1, 2, 3
+
+    def __init__(self):
+        # (col, tile) -> { id(sheet): [sheet, data, formulas, strings] }
+        self.tiles = {}
+        # (col, tile) of tiles containing formulas
+        self.formula_tiles = set()
+        self.hits = 0
+        self.misses = 0
+        self.pending = deque()
+
+    def _entry(self, sheet, col, tile, create = False):
+        entries = self.tiles.get((col, tile))
+        if entries is not None:
+            entry = entries.get(id(sheet))
+            # holding the sheet in entry guarantees its id is not reused by another object
+            if entry is not None and entry[0] is sheet:
+                return entry
+        if not create:
+            return None
+        entry = [sheet, None, None, {}]
+        self.tiles.setdefault((col, tile), {})[id(sheet)] = entry
+        return entry
+
+    def _array(self, sheet, start_col, end_col, start_row, end_row, kind):
+        """
+        A 2d-tuple with data or formulas of given cells, fetching whole tiles with
+        one call if any is missing. Returns the array and whether it was fetched.
+        """
+        while self.pending:
+            self.invalidate(*self.pending.popleft())
+
+        first_tile = start_row // self.tile_rows
+        last_tile = end_row // self.tile_rows
+        columns = xrange(start_col, end_col+1)
+
+        fetched = False
+        for col in columns:
+            for tile in xrange(first_tile, last_tile+1):
+                entry = self._entry(sheet, col, tile)
+                if entry is None or entry[kind] is None:
+                    fetched = True
+                    break
+            if fetched:
+                break
+
+        if fetched:
+            block = sheet.getCellRangeByPosition(start_col, first_tile * self.tile_rows,
+                                                 end_col, (last_tile + 1) * self.tile_rows - 1)
+            if kind == self.DATA:
+                rows = block.getDataArray()
+                flag = uno.getConstantByName('com.sun.star.sheet.CellFlags.FORMULA')
+                for address in block.queryContentCells(flag).getRangeAddresses():
+                    for col in xrange(address.StartColumn, address.EndColumn+1):
+                        for tile in xrange(address.StartRow // self.tile_rows,
+                                           address.EndRow // self.tile_rows + 1):
+                            self.formula_tiles.add((col, tile))
+            else:
+                rows = block.getFormulaArray()
+            for i, col in enumerate(columns):
+                column = [ row[i] for row in rows ]
+                for tile in xrange(first_tile, last_tile+1):
+                    offset = (tile - first_tile) * self.tile_rows
+                    cells = tuple(column[offset:offset+self.tile_rows])
+                    self._entry(sheet, col, tile, True)[kind] = cells
+                    if kind == self.FORMULAS and [ f for f in cells if f.startswith('=') ]:
+                        self.formula_tiles.add((col, tile))
+
+        result = []
+        for row in xrange(start_row, end_row+1):
+            tile, offset = divmod(row, self.tile_rows)
+            result.append(tuple([ self._entry(sheet, col, tile)[kind][offset] for col in columns ]))
+        return tuple(result), fetched
+
+    def _count(self, fetched):
+        if fetched:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def data_array(self, sheet, start_col, end_col, start_row, end_row):
+        array, fetched = self._array(sheet, start_col, end_col, start_row, end_row, self.DATA)
+        self._count(fetched)
+        return array
+
+    def formula_array(self, sheet, start_col, end_col, start_row, end_row):
+        array, fetched = self._array(sheet, start_col, end_col, start_row, end_row, self.FORMULAS)
+        self._count(fetched)
+        return array
+
+    def value(self, sheet, col, row):
+        data = self.data_array(sheet, col, col, row, row)[0][0]
+        if type(data) is types.FloatType:
+            return data
+        return 0.0
+
+    def formula(self, sheet, col, row):
+        return self.formula_array(sheet, col, col, row, row)[0][0]
+
+    def string(self, sheet, col, row):
+        array, fetched = self._array(sheet, col, col, row, row, self.DATA)
+        data = array[0][0]
+        if type(data) is not types.FloatType:
+            self._count(fetched)
+            return data
+
+        strings = self._entry(sheet, col, row // self.tile_rows)[self.STRINGS]
+        try:
+            string = strings[row]
+        except KeyError:
+            fetched = True
+            string = strings[row] = sheet.getCellByPosition(col, row).getString()
+        self._count(fetched)
+        return string
+
+    def invalidate(self, start_col = None, end_col = None, start_row = None, end_row = None):
+        """
+        Drops tiles intersecting given cells, in all sheets, and all tiles with formulas.
+        If no cells are given, drops everything.
+        """
+        if start_col is None:
+            self.tiles.clear()
+            self.formula_tiles.clear()
+            return
+
+        for col in xrange(start_col, end_col+1):
+            for tile in xrange(start_row // self.tile_rows, end_row // self.tile_rows + 1):
+                self.tiles.pop((col, tile), None)
+
+        for key in self.formula_tiles:
+            self.tiles.pop(key, None)
+        self.formula_tiles.clear()
+
+    def invalidate_later(self, *cells):
+        """Same as invalidate(), but only when cache is read again. Safe to be called from any thread."""
+        self.pending.append(cells)
+
 class OOSheet(OODoc):
     """
     Interacts with an OpenOffice.org Spreadsheet instance.
     This high-level library works with a group of cells defined by a selector.
     """
 
+    # Approximate number of cells fetched at once by iter_blocks()
+    block_cells = 10000
+
+    # Parsed selectors, see _parse_selector()
+    _parsed_selectors = _BoundedCache(4096)
+
+    # Writable cell properties that are contents, not formatting. See copy_format_from()
+    _content_properties = ('FormulaLocal',)
+
     def __init__(self, selector = None, _row_sliced = False):
         """
         Constructor gets a selector as parameter. Selector can be one of the following forms:
@@ -238,7 +460,9 @@ class OOSheet(OODoc):
         Selector is case-insensitive
         """
         super(OOSheet, self).__init__()
-        
+
+        self._row_sliced = _row_sliced
+
         if not selector:
             address = self.model.CurrentSelection.RangeAddress
             self.sheet = self.model.Sheets.getByIndex(address.Sheet)
@@ -248,14 +472,28 @@ class OOSheet(OODoc):
             self.end_row = address.EndRow
             
             return
-        
+
+        (sheet_name,
+         self.start_col, self.end_col,
+         self.start_row, self.end_row) = self._parse_selector(selector)
+
+        self.sheet = self._get_sheet(sheet_name)
+
+    def _parse_selector(self, selector):
+        """
+        Parses a selector string into a tuple (sheet_name, start_col, end_col, start_row, end_row).
+        Sheet name is None if selector has no sheet.
+        Results are memoized, since same selectors tend to be used again and again.
+        """
+        parsed = self._parsed_selectors.get(selector)
+        if parsed is not None:
+            return parsed
+
         try:
             sheet_name, cells = selector.split('.')
-            self.sheet = self.model.Sheets.getByName(sheet_name)
         except ValueError:
-            self.sheet = self.model.Sheets.getByIndex(0)
-            cells = selector
-        cells.replace('$', '')
+            sheet_name, cells = None, selector
+        cells = cells.replace('$', '')
         cells = cells.upper()
 
         if ':' in cells:
@@ -263,14 +501,100 @@ class OOSheet(OODoc):
             if not re.match('^[A-Z]', end):
                 col, row = self._position(start)
                 end = ''.join([col_name(col), end])
-            self.start_col, self.start_row = self._position(start)
-            self.end_col, self.end_row = self._position(end)
+            start_col, start_row = self._position(start)
+            end_col, end_row = self._position(end)
         else:
-            col, row = self._position(cells)
-            self.start_col, self.end_col = col, col
-            self.start_row, self.end_row = row, row
+            start_col, start_row = self._position(cells)
+            end_col, end_row = start_col, start_row
 
-        self._row_sliced = _row_sliced
+        parsed = (sheet_name, start_col, end_col, start_row, end_row)
+        self._parsed_selectors.put(selector, parsed)
+        return parsed
+
+    def _get_sheet(self, sheet_name):
+        """
+        The sheet object with given name, or the first sheet if name is None.
+        Sheet objects are cached by name, so that only the first lookup of a sheet goes to LibreOffice.
+        """
+        try:
+            return OODoc._sheets[sheet_name]
+        except KeyError:
+            pass
+
+        if sheet_name is None:
+            sheet = self.model.Sheets.getByIndex(0)
+        else:
+            sheet = self.model.Sheets.getByName(sheet_name)
+        OODoc._sheets[sheet_name] = sheet
+        return sheet
+
+    def enable_cache(self):
+        """
+        Enables a read-through cache of cells for this document. While enabled, value, string, formula,
+        data_array and formula_array are read in blocks and then served locally, until cells are modified
+        by OOSheet. Changes made by other means, like by user, are not noticed, so cache should only be
+        enabled while a script is working.
+
+        Cache statistics can be obtained by the "hits" and "misses" attributes of cell_cache.
+        """
+        if OODoc._cell_cache is None:
+            OODoc._cell_cache = _CellCache()
+        return self
+
+    def disable_cache(self):
+        """Disables and drops the cache of cells. See enable_cache()"""
+        OODoc._cell_cache = None
+        return self
+
+    @property
+    def cell_cache(self):
+        """The cache of cells of this document, or None if not enabled. See enable_cache()"""
+        return OODoc._cell_cache
+
+    def watch_changes(self):
+        """
+        Starts recording changes to cells of this document, by OOSheet, other macros or the user,
+        and returns the OOChangeFeed where they're recorded. While changes are watched, the cache
+        of cells is also invalidated by changes made by other means than OOSheet, and so is the
+        cache of sheet objects by changes to sheets, see clear_sheet_cache().
+        """
+        if OODoc._change_feed is None:
+            OODoc._change_feed = OOChangeFeed(self.model)
+        return OODoc._change_feed
+
+    def unwatch_changes(self):
+        """Stops recording changes. See watch_changes()"""
+        if OODoc._change_feed is not None:
+            OODoc._change_feed.close()
+            OODoc._change_feed = None
+        return self
+
+    def _invalidate(self, everything = False):
+        """
+        Drops cached data of cells of this selection, after they're modified.
+        If cells have been moved, like when rows are inserted, "everything" must be True.
+        """
+        if OODoc._cell_cache is None:
+            return
+        if everything:
+            OODoc._cell_cache.invalidate()
+        else:
+            OODoc._cell_cache.invalidate(self.start_col, self.end_col, self.start_row, self.end_row)
+
+    def clear_sheet_cache(self):
+        """
+        Forgets the cached sheet objects. Must be called if sheets are renamed, removed or
+        reordered by other means than OOSheet, like by user or by Uno directly, unless changes are
+        being watched, see watch_changes().
+
+        Otherwise, a selector keeps reaching the sheet that had its name when it was first used:
+        after Sheet2 is renamed, S('Sheet2.a1') still returns cells of the renamed sheet, and if
+        another sheet named Sheet2 is created, cells would be read from and written to the wrong sheet.
+        """
+        OODoc._sheets = {}
+        if OODoc._cell_cache is not None:
+            OODoc._cell_cache.invalidate()
+        return self
 
     @property
     def selector(self):
@@ -301,6 +625,27 @@ class OOSheet(OODoc):
         assert self.start_row == self.end_row
         return self.sheet.getCellByPosition(self.start_col, self.start_row)
 
+    @property
+    def cell_range(self):
+        """
+        A python-uno com.sun.star.table.XCellRange object, representing all cells
+        of this selector. Bulk operations go through this object.
+        """
+        return self.sheet.getCellRangeByPosition(self.start_col, self.start_row,
+                                                 self.end_col, self.end_row)
+
+    @property
+    def _single_cell(self):
+        return self.start_col == self.end_col and self.start_row == self.end_row
+
+    def _fill(self, data):
+        """
+        A 2d-tuple with the size of this selection, with all positions holding the given data.
+        Suitable for setDataArray() and setFormulaArray()
+        """
+        row = (data,) * self.width
+        return (row,) * self.height
+
     @property
     def _cells(self):
         """
@@ -333,16 +678,16 @@ class OOSheet(OODoc):
             row_sliced = True
 
         if not row_sliced:
-            return OOSheet(self._generate_selector(self.start_col,
-                                                   self.end_col,
-                                                   self.start_row + start,
-                                                   self.start_row + stop),
-                           _row_sliced = True)
+            return self._derive(self.start_col,
+                                self.end_col,
+                                self.start_row + start,
+                                self.start_row + stop,
+                                _row_sliced = True)
         else:
-            return OOSheet(self._generate_selector(self.start_col + start,
-                                                   self.start_col + stop,
-                                                   self.start_row,
-                                                   self.end_row))
+            return self._derive(self.start_col + start,
+                                self.start_col + stop,
+                                self.start_row,
+                                self.end_row)
 
 
     def __cmp__(self, peer):
@@ -354,34 +699,46 @@ class OOSheet(OODoc):
 
         
 
+    def _derive(self, start_col, end_col, start_row, end_row, _row_sliced = False):
+        """
+        Builds a new OOSheet object in the same sheet as this one, directly from coordinates.
+        No selector is parsed and Uno is not touched, so this is cheap enough to be done
+        for each cell of large selections.
+        """
+        derived = object.__new__(type(self))
+        derived.__dict__.update(self.__dict__)
+        derived.start_col, derived.end_col = start_col, end_col
+        derived.start_row, derived.end_row = start_row, end_row
+        derived._row_sliced = _row_sliced
+        return derived
+
     @property
     def cells(self):
         """
         A generator of all cells of this selector. Each cell returned will be a
         single-cell OOSheet object        
         """
-        for col in range(self.start_col, self.end_col+1):
-            for row in range(self.start_row, self.end_row+1):
-                yield OOSheet(self._generate_selector(col, col, row, row))
+        for col in xrange(self.start_col, self.end_col+1):
+            for row in xrange(self.start_row, self.end_row+1):
+                yield self._derive(col, col, row, row)
 
     @property
     def rows(self):
         """
-        A generator of all cells of this selector. Each cell returned will be a
-        single-cell OOSheet object        
+        A generator of all rows of this selector. Each row returned will be a
+        single-row OOSheet object
         """
-        for row in range(self.start_row, self.end_row+1):
-            yield OOSheet(self._generate_selector(self.start_col, self.end_col, row, row),
-                          _row_sliced = True)
+        for row in xrange(self.start_row, self.end_row+1):
+            yield self._derive(self.start_col, self.end_col, row, row, _row_sliced = True)
 
     @property
     def columns(self):
         """
-        A generator of all cells of this selector. Each cell returned will be a
-        single-cell OOSheet object        
+        A generator of all columns of this selector. Each column returned will be a
+        single-column OOSheet object
         """
-        for col in range(self.start_col, self.end_col+1):
-            yield OOSheet(self._generate_selector(col, col, self.start_row, self.end_row))
+        for col in xrange(self.start_col, self.end_col+1):
+            yield self._derive(col, col, self.start_row, self.end_row)
 
         
 
@@ -391,8 +748,178 @@ class OOSheet(OODoc):
         A 2d-tuple with all data of this selection at once.
         Uses Uno's getDataArray().
         """
-        return self.sheet.getCellRangeByName(self.selector).getDataArray()
-        
+        if OODoc._cell_cache is not None:
+            return OODoc._cell_cache.data_array(self.sheet, self.start_col, self.end_col,
+                                                self.start_row, self.end_row)
+        return self.cell_range.getDataArray()
+
+    @data_array.setter
+    def data_array(self, data):
+        """
+        Sets all data of this selection at once. Expects a 2d-sequence (rows of columns) with
+        same size as selection. Numbers become values and strings become strings, while None
+        and NaN leave cells empty and booleans become numbers, see _cell_data().
+        Uses Uno's setDataArray().
+        """
+        data = [ [ self._cell_data(cell_data) for cell_data in row ] for row in data ]
+        self.cell_range.setDataArray(self._to_array(data))
+        self._invalidate()
+
+    @property
+    def formula_array(self):
+        """
+        A 2d-tuple with formulas of all cells of this selection at once.
+        Uses Uno's getFormulaArray().
+        """
+        if OODoc._cell_cache is not None:
+            return OODoc._cell_cache.formula_array(self.sheet, self.start_col, self.end_col,
+                                                   self.start_row, self.end_row)
+        return self.cell_range.getFormulaArray()
+
+    @formula_array.setter
+    def formula_array(self, data):
+        """
+        Sets formulas of all cells of this selection at once. Expects a 2d-sequence (rows of columns)
+        with same size as selection. Uses Uno's setFormulaArray().
+        """
+        self.cell_range.setFormulaArray(self._to_array(data))
+        self._invalidate()
+
+    def _cell_data(self, data):
+        """
+        Converts a python object to data accepted by setDataArray(). None and NaN become
+        empty cells and booleans become numbers.
+        """
+        if data is None or (type(data) is types.FloatType and data != data):
+            return u''
+        if type(data) is types.BooleanType:
+            return float(data)
+        return data
+
+    def to_numpy(self, dtype = float):
+        """
+        All data of this selection as a 2d NumPy array, with one getDataArray() call.
+        Requires NumPy.
+
+        With a float dtype, empty cells and cells with strings become NaN. With an integer or
+        boolean dtype, data is converted through float, and ValueError is raised if any cell
+        is empty or has a string. With dtype=object, empty cells become NaN and strings are
+        preserved. Other dtypes are not supported.
+        """
+        import numpy
+
+        nan = float('nan')
+        kind = numpy.dtype(dtype).kind
+        assert kind in 'fciubO', "Unsupported dtype %s" % dtype
+
+        if kind == 'O':
+            convert = lambda data: nan if data == u'' else data
+            return numpy.array([ [ convert(data) for data in row ] for row in self.data_array ],
+                               dtype = dtype)
+
+        convert = lambda data: data if type(data) is types.FloatType else nan
+        array = numpy.array([ [ convert(data) for data in row ] for row in self.data_array ],
+                            dtype = float)
+        if kind in 'fc':
+            return array.astype(dtype)
+
+        if numpy.isnan(array).any():
+            raise ValueError("Empty or non-numeric cells in %s can't be converted to %s" %
+                             (self.selector, numpy.dtype(dtype).name))
+        return array.astype(dtype)
+
+    def from_numpy(self, array):
+        """
+        Writes a 2d NumPy array (or anything numpy.asarray() accepts) to this selection with one
+        setDataArray() call. A 1d array is written as a column. NaN and None leave cells empty.
+
+        If selector is a single cell, it's expanded to the shape of the array, otherwise the
+        shape must match the selection. Requires NumPy.
+        """
+        import numpy
+
+        array = numpy.asarray(array)
+        if array.ndim == 1:
+            array = array.reshape((array.shape[0], 1))
+        assert array.ndim == 2
+
+        if self._single_cell:
+            self.end_row = self.start_row + array.shape[0] - 1
+            self.end_col = self.start_col + array.shape[1] - 1
+
+        self.data_array = array.tolist()
+        return self
+
+    def iter_blocks(self, rows = None, prefetch = False):
+        """
+        A generator of the data of this selection, fetched with getDataArray() in blocks of
+        "rows" rows. Each block is a 2d-tuple, as in data_array, so large selections can be
+        processed without holding all of them in memory.
+
+        If rows is not given, it's calculated from the width of the selection so that each
+        block holds about OOSheet.block_cells cells.
+
+        If prefetch is True, the next block is fetched in background while the current one
+        is being processed.
+        """
+        if rows is None:
+            rows = max(1, self.block_cells // self.width)
+
+        positions = [ (start, min(start + rows - 1, self.end_row))
+                      for start in xrange(self.start_row, self.end_row+1, rows) ]
+
+        if not prefetch:
+            for start, end in positions:
+                yield self._fetch_block(start, end)
+            return
+
+        pending = None
+        for start, end in positions:
+            fetcher = _Prefetcher(self._fetch_block, start, end)
+            if pending is not None:
+                yield pending.get()
+            pending = fetcher
+        if pending is not None:
+            yield pending.get()
+
+    def iter_rows(self, chunk = None, prefetch = False):
+        """
+        A generator of the data of each row of this selection, as tuples. Data is fetched in blocks
+        of "chunk" rows, see iter_blocks().
+        """
+        for block in self.iter_blocks(chunk, prefetch):
+            for row in block:
+                yield row
+
+    def writer(self, buffer_size = 1000, insert = False):
+        """
+        Returns an OOSheetWriter that writes rows starting at the first row of this selector,
+        with same width. See OOSheetWriter.
+        """
+        return OOSheetWriter(self, buffer_size, insert)
+
+    def snapshot(self):
+        """
+        Returns an OOSheetSnapshot with all data of this selection, that can be modified locally
+        and then committed, writing back only cells that changed. See OOSheetSnapshot.
+        """
+        return OOSheetSnapshot(self)
+
+    def _fetch_block(self, start_row, end_row):
+        return self.sheet.getCellRangeByPosition(self.start_col, start_row,
+                                                 self.end_col, end_row).getDataArray()
+
+    def _to_array(self, data):
+        """
+        Converts a 2d-sequence to a 2d-tuple, as expected by Uno's array setters, checking
+        that it matches the size of this selection.
+        """
+        data = tuple([ tuple(row) for row in data ])
+        assert len(data) == self.height
+        for row in data:
+            assert len(row) == self.width
+        return data
+
 
     def __repr__(self):
         try:
@@ -409,30 +936,38 @@ class OOSheet(OODoc):
         return self.end_row - self.start_row + 1
 
     def _position(self, descriptor):
-        col = re.findall('^([A-Z]+)', descriptor)[0]
-        row = descriptor[len(col):]
-            
-        col = col_index(col)
-        row = int(row) - 1
-
-        return col, row
+        return col_position(descriptor)
 
     @property
     def basedate(self):
-        """Hard-coded datetime.datetime object representing the date that corresponds to value 0"""
-        return datetime(1899, 12, 30)
+        """
+        datetime.datetime object representing the date that corresponds to value 0, as configured
+        in the document (usually 30/12/1899).
+        """
+        if OODoc._basedate is None:
+            try:
+                null_date = self.model.NullDate
+                OODoc._basedate = datetime(null_date.Year, null_date.Month, null_date.Day)
+            except AttributeError:
+                OODoc._basedate = datetime(1899, 12, 30)
+        return OODoc._basedate
 
     @property
     def value(self):
         """The float value of a cell. Only works for single-cell selectors"""
-        assert self.cell is not None
+        assert self._single_cell
+        if OODoc._cell_cache is not None:
+            return OODoc._cell_cache.value(self.sheet, self.start_col, self.start_row)
         return self.cell.getValue()
 
     @value.setter
     def value(self, value):
         """Sets the float value of all cells affected by this selector. Expects a float."""
-        for cell in self._cells:
-            cell.setValue(value)
+        if self._single_cell:
+            self.cell.setValue(value)
+        else:
+            self.cell_range.setDataArray(self._fill(float(value)))
+        self._invalidate()
 
     def set_value(self, value):
         """Sets the float value of all cells affected by this selector. Expects a float."""
@@ -442,7 +977,9 @@ class OOSheet(OODoc):
     @property
     def formula(self):
         """The formula of a cell. Only works for single-cell selectors"""
-        assert self.cell is not None
+        assert self._single_cell
+        if OODoc._cell_cache is not None:
+            return OODoc._cell_cache.formula(self.sheet, self.start_col, self.start_row)
         return self.cell.getFormula()
 
     @formula.setter
@@ -450,8 +987,11 @@ class OOSheet(OODoc):
         """Sets the formula of all cells affected by this selector. Expects a string"""
         if not formula.startswith('='):
             formula = '=%s' % formula
-        for cell in self._cells:
-            cell.setFormula(formula)
+        if self._single_cell:
+            self.cell.setFormula(formula)
+        else:
+            self.cell_range.setFormulaArray(self._fill(formula))
+        self._invalidate()
 
     def set_formula(self, formula):
         """Sets the formula of all cells affected by this selector. Expects a string"""
@@ -461,14 +1001,19 @@ class OOSheet(OODoc):
     @property
     def string(self):
         """The string representation of a cell. Only works for single-cell selectors"""
-        assert self.cell is not None
+        assert self._single_cell
+        if OODoc._cell_cache is not None:
+            return OODoc._cell_cache.string(self.sheet, self.start_col, self.start_row)
         return self.cell.getString()
 
     @string.setter
     def string(self, string):
         """Sets the string of all cells affected by this selector. Expects a string."""
-        for cell in self._cells:
-            cell.setString(string)
+        if self._single_cell:
+            self.cell.setString(string)
+        else:
+            self.cell_range.setDataArray(self._fill(string))
+        self._invalidate()
 
     def set_string(self, string):
         """Sets the string of all cells affected by this selector. Expects a string."""
@@ -478,7 +1023,7 @@ class OOSheet(OODoc):
     @property
     def date(self):
         """The date representation of a cell. Only works for single-cell selectors"""
-        assert self.cell is not None
+        assert self._single_cell
         return self.basedate + timedelta(self.value)
 
     @date.setter
@@ -486,59 +1031,123 @@ class OOSheet(OODoc):
         """Sets the date of all cells affected by this selector. Expects a datetime.datetime object."""
         delta = date - self.basedate
         self.value = delta.days
-
-        date_format = uno.getConstantByName( "com.sun.star.util.NumberFormat.DATE" )
-        formats = self.model.getNumberFormats()
-        cells = self.sheet.getCellRangeByName(self.selector)
-        #if formats.getByKey(cells).Type != date_format:
-        for cell in self._cells:
-            if formats.getByKey(cell.NumberFormat).Type != date_format:
-                locale = uno.createUnoStruct( "com.sun.star.lang.Locale" )
-                cell.NumberFormat = formats.getStandardFormat( date_format, locale )
-
+        self._set_date_format()
 
     def set_date(self, date):
         """Sets the date of all cells affected by this selector. Expects a datetime.datetime object."""
         self.date = date
         return self
 
+    @property
+    def dates_array(self):
+        """
+        A 2d-tuple with dates of all cells of this selection at once, as datetime.datetime objects.
+        Cells without a number are represented by None.
+        """
+        basedate = self.basedate
+        return tuple([ tuple([ basedate + timedelta(data) if type(data) is types.FloatType else None
+                               for data in row ])
+                       for row in self.data_array ])
+
+    @dates_array.setter
+    def dates_array(self, dates):
+        """
+        Sets dates of all cells of this selection at once. Expects a 2d-sequence of datetime.datetime
+        objects with same size as selection, None leaves a cell empty.
+        Data is written with one setDataArray() and cells not yet in a date format get the standard one.
+        """
+        self.data_array = [ [ self._date_to_value(date) for date in row ] for row in dates ]
+        self._set_date_format()
+
+    def _date_to_value(self, date):
+        """Converts a datetime.date or datetime.datetime object to a value, counting days since basedate"""
+        if date is None:
+            return u''
+        if type(date) is not datetime:
+            date = datetime(date.year, date.month, date.day)
+        delta = date - self.basedate
+        return delta.days + delta.seconds / 86400.0
+
+    def _set_date_format(self):
+        """
+        Sets the standard date format on cells of this selection that are not already formatted as date.
+        Cells are grouped by getCellFormatRanges() and all of them are formatted with one property set,
+        using format keys cached per document, so this takes few calls no matter the size of selection.
+        """
+        date_format = uno.getConstantByName( "com.sun.star.util.NumberFormat.DATE" )
+        formats = self.model.getNumberFormats()
+
+        format_ranges = self.cell_range.getCellFormatRanges()
+        addresses = []
+        for i in range(format_ranges.getCount()):
+            format_range = format_ranges.getByIndex(i)
+            key = format_range.NumberFormat
+            if key not in OODoc._format_types:
+                OODoc._format_types[key] = formats.getByKey(key).Type
+            if not OODoc._format_types[key] & date_format:
+                addresses.append(format_range.getRangeAddress())
+
+        if not addresses:
+            return
+
+        if OODoc._date_format is None:
+            locale = uno.createUnoStruct( "com.sun.star.lang.Locale" )
+            OODoc._date_format = formats.getStandardFormat( date_format, locale )
+
+        ranges = self.model.createInstance("com.sun.star.sheet.SheetCellRanges")
+        ranges.addRangeAddresses(tuple(addresses), False)
+        ranges.NumberFormat = OODoc._date_format
+        self._invalidate() # strings depend on format
+
     def focus(self):
         """Focuses on all cells of this selector"""
         self.dispatch('GoToCell', ('ToPoint', self.selector))
 
     def drag_to(self, destiny):
         """
-        Focuses on cells and drag to the destiny specified by given selector, doing an AutoFill.
-        Destiny is a selector string
+        Does an AutoFill from cells of this selection to the destiny specified by given selector,
+        as when dragging the little square in the bottom right corner of the selection.
+        Destiny is a selector string or an OOSheet object in the same sheet.
+        The selection is expanded to include the destiny.
+        The fill is done directly in the cell range, so no focus or user interface is needed.
         """
 
-        if '.' in destiny:
-            sheet_name, destiny = destiny.split('.')
-            assert sheet_name == self.sheet.Name
-            
-        self.focus()
-        self.dispatch('AutoFill', ('EndCell', '%s.%s' % (self.sheet.Name, destiny)))
-
-        if '.' not in destiny:
-            destiny = '.'.join([self.sheet.Name, destiny])
+        if type(destiny) is not type(self):
+            if '.' not in destiny:
+                destiny = '.'.join([self.sheet.Name, destiny])
+            destiny = OOSheet(destiny)
+        assert destiny.sheet.Name == self.sheet.Name
+
+        if destiny.end_row > self.end_row:
+            direction, count = 'TO_BOTTOM', self.height
+        elif destiny.start_row < self.start_row:
+            direction, count = 'TO_TOP', self.height
+        elif destiny.end_col > self.end_col:
+            direction, count = 'TO_RIGHT', self.width
+        elif destiny.start_col < self.start_col:
+            direction, count = 'TO_LEFT', self.width
+        else:
+            return self
 
-        destiny = OOSheet(destiny)
         self.start_col = min(self.start_col, destiny.start_col)
         self.start_row = min(self.start_row, destiny.start_row)
         self.end_col = max(self.end_col, destiny.end_col)
         self.end_row = max(self.end_row, destiny.end_row)
 
+        self.cell_range.fillAuto(uno.Enum('com.sun.star.sheet.FillDirection', direction), count)
+        self._invalidate()
+
         return self
 
     def delete_rows(self):
         """Delete all rows that intersect with this selector"""
-        self.focus()
-        self.dispatch('DeleteRows')
+        self.sheet.getRows().removeByIndex(self.start_row, self.height)
+        self._invalidate(everything = True)
 
     def delete_columns(self):
         """Delete all columns that intersect with this selector"""
-        self.focus()
-        self.dispatch('DeleteColumns')
+        self.sheet.getColumns().removeByIndex(self.start_col, self.width)
+        self._invalidate(everything = True)
 
     def insert_row(self):
         """Insert rows before this selector. The current selector is shift down, and expanded
@@ -547,9 +1156,8 @@ class OOSheet(OODoc):
 
     def insert_rows(self, num):
         """Works as insert_row(), but inserts several rows"""
-        self.focus()
-        for i in range(num):
-            self.dispatch('InsertRows')
+        self.sheet.getRows().insertByIndex(self.start_row, num)
+        self._invalidate(everything = True)
         self.end_row += num
         return self
 
@@ -562,26 +1170,70 @@ class OOSheet(OODoc):
 
     def insert_columns(self, num):
         """Works as insert_column(), but inserts several columns"""
-        self.focus()
-        for i in range(num):
-            self.dispatch('InsertColumns')
+        self.sheet.getColumns().insertByIndex(self.start_col, num)
+        self._invalidate(everything = True)
         self.end_col += num
         return self
 
     def flatten(self):
-        """Keeps the value and string of cells in selection, but make them independent of a formula."""
-        self.copy()
-        self.focus()
-        self.dispatch('InsertContents',
-                      ('Flags', 'SVDNT'),
-                      ('FormulaCommand', 0),
-                      ('SkipEmptyCells', False),
-                      ('Transpose', False),
-                      ('AsLink', False),
-                      ('MoveMode', 4),
-                      )
+        """
+        Keeps the value and string of cells in selection, but make them independent of a formula.
+        Done by reading and writing the data array, so clipboard is not used.
+        """
+        cell_range = self.cell_range
+        cell_range.setDataArray(cell_range.getDataArray())
+        self._invalidate()
         return self
         
+    @property
+    def used_range(self):
+        """
+        An OOSheet object with the used area of this selection's sheet, from the first to the last
+        row and column with content. Obtained with a sheet cursor, in a constant number of calls.
+        """
+        cursor = self.sheet.createCursor()
+        cursor.gotoStartOfUsedArea(False)
+        cursor.gotoEndOfUsedArea(True)
+        return self._derive_from_address(cursor.getRangeAddress())
+
+    @property
+    def current_region(self):
+        """
+        An OOSheet object with the region of cells with content around this selection, limited
+        by empty rows and columns, like the one selected by Ctrl-* in LibreOffice.
+        """
+        cursor = self.sheet.createCursorByRange(self.cell_range)
+        cursor.collapseToCurrentRegion()
+        return self._derive_from_address(cursor.getRangeAddress())
+
+    @property
+    def end_of_data(self):
+        """
+        An OOSheet object with the row just below the current region, with same columns of this selector.
+        This is where data should be appended to a table.
+        If there's no data around this selector, its first row is returned.
+        """
+        region = self.current_region
+        same = ((region.start_col, region.end_col, region.start_row, region.end_row) ==
+                (self.start_col, self.end_col, self.start_row, self.end_row))
+        if same and not self._has_content(region):
+            row = self.start_row
+        else:
+            row = region.end_row + 1
+        return self._derive(self.start_col, self.end_col, row, row)
+
+    def _has_content(self, selection):
+        """Whether any cell of given selection has a value, string or formula"""
+        flags = 0
+        for flag in ('VALUE', 'DATETIME', 'STRING', 'FORMULA'):
+            flags |= uno.getConstantByName('com.sun.star.sheet.CellFlags.%s' % flag)
+        return len(selection.cell_range.queryContentCells(flags).getRangeAddresses()) > 0
+
+    def _derive_from_address(self, address):
+        """Builds a new OOSheet object from a com.sun.star.table.CellRangeAddress in this sheet"""
+        return self._derive(address.StartColumn, address.EndColumn,
+                            address.StartRow, address.EndRow)
+
     @property
     def first_row(self):
         return self.clone().shrink_down(self.height - 1)
@@ -595,6 +1247,41 @@ class OOSheet(OODoc):
     def last_column(self):
         return self.clone().shrink_left(self.width - 1)
     
+    def _destination(self, destiny):
+        """
+        The OOSheet object with size of this selection and top left corner at given destiny,
+        which may be an OOSheet object or a selector string, in any sheet.
+        """
+        if type(destiny) is not type(self):
+            destiny = OOSheet(destiny)
+        return destiny._derive(destiny.start_col, destiny.start_col + self.width - 1,
+                               destiny.start_row, destiny.start_row + self.height - 1)
+
+    def copy_to(self, destiny):
+        """
+        Copies all contents and formatting of cells in this selection to destiny, an OOSheet object
+        or selector, possibly in another sheet. Only the top left corner of destiny is considered.
+        Unlike copy() and paste(), clipboard and user interface are not used.
+        Returns an OOSheet object with the copied cells.
+        """
+        destiny = self._destination(destiny)
+        address = destiny.sheet.getCellByPosition(destiny.start_col, destiny.start_row).getCellAddress()
+        self.sheet.copyRange(address, self.cell_range.getRangeAddress())
+        destiny._invalidate()
+        return destiny
+
+    def move_to(self, destiny):
+        """
+        Works as copy_to(), but cells in this selection are cleared, as with cut() and paste().
+        References to moved cells in formulas are adjusted.
+        Returns an OOSheet object with the moved cells.
+        """
+        destiny = self._destination(destiny)
+        address = destiny.sheet.getCellByPosition(destiny.start_col, destiny.start_row).getCellAddress()
+        self.sheet.moveRange(address, self.cell_range.getRangeAddress())
+        self._invalidate(everything = True) # formulas may have been adjusted anywhere
+        return destiny
+
     def copy(self):
         """Focuses and copies the contents, so it can be pasted somewhere else"""
         self.focus()
@@ -621,26 +1308,36 @@ class OOSheet(OODoc):
     def format_as(self, selector):
         """
         Copies to the current selector the formmating of the given selector.
-        Internally, copies the other selector and does a "paste special" in the current cells,
-        pasting everything but data. No success has been achieved while trying to use the "brush" tool.
+        Same as copy_format_from(), kept for compatibility.
         """
+        return self.copy_format_from(selector)
 
-        if type(selector) is type(self):
-            selector = selector.selector
-            
-        OOSheet(selector).copy()
-        self.focus()
-        self.dispatch('InsertContents',
-                      ('Flags', 'T'),
-                      ('FormulaCommand', 0),
-                      ('SkipEmptyCells', False),
-                      ('Transpose', False),
-                      ('AsLink', False),
-                      ('MoveMode', 4),
-                      )
-
-        self.dispatch('TerminateInplaceActivation')
-        self.dispatch('Cancel')
+    def copy_format_from(self, other):
+        """
+        Copies to all cells of this selection the formatting of the top left cell of other selector,
+        which may be an OOSheet object or a selector string.
+        Properties set directly in the source cell, including its cell style, are read at once and set
+        in the whole range with one call, and the ones not set are reset to defaults, as in a "paste special"
+        of formats. Clipboard and user interface are not used.
+        """
+        if type(other) is not type(self):
+            other = OOSheet(other)
+
+        cell = other.sheet.getCellByPosition(other.start_col, other.start_row)
+        readonly = uno.getConstantByName('com.sun.star.beans.PropertyAttribute.READONLY')
+        names = tuple([ prop.Name for prop in cell.getPropertySetInfo().getProperties()
+                        if not prop.Attributes & readonly and prop.Name not in self._content_properties ])
+
+        direct = uno.Enum('com.sun.star.beans.PropertyState', 'DIRECT_VALUE')
+        states = cell.getPropertyStates(names)
+        defaults = tuple([ name for name, state in zip(names, states) if state != direct ])
+        names = tuple([ name for name, state in zip(names, states) if state == direct ])
+
+        cell_range = self.cell_range
+        cell_range.setPropertiesToDefault(defaults)
+        cell_range.setPropertyValues(names, cell.getPropertyValues(names))
+        self._invalidate() # strings depend on format
+        return self
 
     def shift(self, col, row):
         """
@@ -678,25 +1375,368 @@ class OOSheet(OODoc):
             return (self.start_col - tup.start_col, self.start_row - tup.start_row)
 
     def find(self, query):
-        if isinstance(query, str) or isinstance(query, unicode):
-            test = lambda(cell): cell.string == query
-        elif isinstance(query, int) or isinstance(query, float):
-            test = lambda(cell): cell.value == query
+        """
+        Returns a generator of single-cell OOSheet objects matching query, in same order as cells.
+
+        If query is a string, cells whose string equals query are searched inside LibreOffice.
+        If query is a number (or a boolean, as 1 or 0), only cells with content are fetched and have
+        their value compared to it.
+        If query is a function, it's called with each single-cell OOSheet object and must return
+        True for the matching ones. Cells are read in blocks before, so value, formula and string of
+        cells with text are served locally, but strings of numbers, which depend on formatting, and
+        any other access to Uno still cost one call per cell.
+
+        The search is done lazily, one block of cells at a time, as results are consumed.
+        """
+        if type(query) in (types.StringType, types.UnicodeType):
+            if query:
+                search = lambda block: block._search_string(query)
+            else:
+                search = lambda block: block._scan_data(lambda data: data == u'')
+        elif type(query) in (types.IntType, types.LongType, types.FloatType, types.BooleanType):
+            if query:
+                search = lambda block: block._search_value(query)
+            else:
+                search = lambda block: block._scan_data(
+                    lambda data: type(data) is not types.FloatType or data == 0)
         elif type(query) is types.FunctionType:
-            test = query
+            search = lambda block: block._scan_cells(query)
         else:
             raise TypeError
 
-        for cell in self.cells:
-            if test(cell):
+        return self._find_in_blocks(search)
+
+    def _cell_blocks(self):
+        """
+        A generator of OOSheet objects with blocks of about OOSheet.block_cells cells of this selection,
+        covering it in same order as cells: several whole columns or, for tall selections, parts of one.
+        """
+        if self.height > self.block_cells:
+            for col in xrange(self.start_col, self.end_col+1):
+                for start in xrange(self.start_row, self.end_row+1, self.block_cells):
+                    end = min(start + self.block_cells - 1, self.end_row)
+                    yield self._derive(col, col, start, end)
+            return
+
+        columns = max(1, self.block_cells // self.height)
+        for start in xrange(self.start_col, self.end_col+1, columns):
+            yield self._derive(start, min(start + columns - 1, self.end_col), self.start_row, self.end_row)
+
+    def _find_in_blocks(self, search):
+        """
+        A generator of single-cell OOSheet objects at positions returned by search() for each block
+        of this selection, so that a block is only searched when previous results are consumed.
+        """
+        for block in self._cell_blocks():
+            for cell in self._cells_at(search(block)):
                 yield cell
 
+    def _search_string(self, string):
+        """
+        Positions of cells whose string is exactly the given one, using Uno's findAll()
+        """
+        cell_range = self.cell_range
+        found = cell_range.findAll(self._search_descriptor(cell_range, string))
+        if found is None:
+            return []
+        return self._range_positions(found.getRangeAddresses())
+
+    def _search_descriptor(self, cell_range, string, backwards = False):
+        """
+        A search descriptor for cell_range that matches cells whose string is exactly the given one
+        """
+        descriptor = cell_range.createSearchDescriptor()
+        descriptor.setPropertyValue('SearchString', string)
+        descriptor.setPropertyValue('SearchWords', True) # whole cell
+        descriptor.setPropertyValue('SearchCaseSensitive', True)
+        descriptor.setPropertyValue('SearchRegularExpression', False)
+        descriptor.setPropertyValue('SearchContentType', 1) # values, not formulas
+        descriptor.setPropertyValue('SearchBackwards', backwards)
+        try:
+            descriptor.setPropertyValue('SearchWildcard', False)
+        except Exception:
+            pass # Not available before LibreOffice 5.2
+        return descriptor
+
+    def _search_value(self, value):
+        """
+        Positions of cells with the given value. Only cells with content, given by Uno's
+        queryContentCells(), are fetched.
+        """
+        flags = 0
+        for flag in ('VALUE', 'DATETIME', 'FORMULA'):
+            flags |= uno.getConstantByName('com.sun.star.sheet.CellFlags.%s' % flag)
+
+        positions = []
+        for address in self.cell_range.queryContentCells(flags).getRangeAddresses():
+            data = self.sheet.getCellRangeByPosition(address.StartColumn, address.StartRow,
+                                                     address.EndColumn, address.EndRow).getDataArray()
+            for row, row_data in enumerate(data):
+                for col, cell_data in enumerate(row_data):
+                    if type(cell_data) is types.FloatType and cell_data == value:
+                        positions.append((address.StartColumn + col, address.StartRow + row))
+        return positions
+
+    def _scan_data(self, test):
+        """
+        Positions of cells whose data, as in data_array, satisfies test. Data is fetched in blocks.
+        """
+        positions = []
+        row = self.start_row
+        for data in self.iter_rows():
+            for col, cell_data in enumerate(data):
+                if test(cell_data):
+                    positions.append((self.start_col + col, row))
+            row += 1
+        return positions
+
+    def _range_positions(self, addresses):
+        """Positions of all cells in a sequence of com.sun.star.table.CellRangeAddress"""
+        positions = []
+        for address in addresses:
+            for col in xrange(address.StartColumn, address.EndColumn+1):
+                for row in xrange(address.StartRow, address.EndRow+1):
+                    positions.append((col, row))
+        return positions
+
+    def _scan_cells(self, function):
+        """
+        Positions of cells for which function returns True, given single-cell OOSheet objects.
+        All cells are read at once into the cache of cells, enabled only during the scan if it's
+        not already, so function can read cells without calling LibreOffice for each one.
+        Used by find() for each block of cells.
+        """
+        temporary = OODoc._cell_cache is None
+        if temporary:
+            self.enable_cache()
+        try:
+            self.data_array # fills cache
+            positions = []
+            for col in xrange(self.start_col, self.end_col+1):
+                for row in xrange(self.start_row, self.end_row+1):
+                    if function(self._derive(col, col, row, row)):
+                        positions.append((col, row))
+            return positions
+        finally:
+            if temporary:
+                self.disable_cache()
+
+    def _cells_at(self, positions):
+        """A generator of single-cell OOSheet objects at given positions, in same order as cells"""
+        for col, row in sorted(positions):
+            yield self._derive(col, col, row, row)
+
     def each(self, function):
+        """
+        Calls function for each cell of this selection, passing a single-cell OOSheet object.
+        For transformations of data, apply() is much faster.
+        """
         if type(function) is not types.FunctionType:
             raise TypeError
         for cell in self.cells:
             function(cell)            
 
+    def apply(self, function, by = 'cell'):
+        """
+        Transforms data of this selection with a python function, reading all data at once
+        with data_array and writing results back at once.
+
+        The "by" parameter determines what function receives and must return:
+        - 'cell': receives the data of each cell (a float or a string), returns new data
+        - 'row': receives a tuple with data of each row, returns a sequence with same length
+        - 'column': receives a tuple with data of each column, returns a sequence with same length
+
+        Empty cells are received as u'', and None can be returned to leave a cell empty.
+        Returns self, so calls can be cascaded.
+        """
+        if not callable(function):
+            raise TypeError
+        assert by in ('cell', 'row', 'column')
+
+        data = self.data_array
+        if by == 'cell':
+            result = [ [ function(cell_data) for cell_data in row ] for row in data ]
+        elif by == 'row':
+            result = [ function(row) for row in data ]
+        else:
+            columns = [ function(column) for column in zip(*data) ]
+            for column in columns:
+                assert len(column) == self.height, \
+                    "Function must return %d values for each column, not %d" % (self.height, len(column))
+            result = zip(*columns)
+
+        self.data_array = result
+        return self
+
+    def compute(self, function):
+        """
+        Computes an aggregate function over all cells of this selection inside LibreOffice, so that
+        no cell is transferred. "function" is the name of a com.sun.star.sheet.GeneralFunction, like
+        'SUM', 'COUNT', 'COUNTNUMS', 'AVERAGE', 'MAX', 'MIN', 'PRODUCT', 'STDEV' or 'VAR'.
+        Returns a float.
+        """
+        function = uno.Enum('com.sun.star.sheet.GeneralFunction', function.upper())
+        return self.cell_range.computeFunction(function)
+
+    def sum(self):
+        """Sum of numbers in this selection"""
+        return self.compute('SUM')
+    def count(self):
+        """Number of cells with content in this selection, numbers or strings"""
+        return self.compute('COUNT')
+    def count_numbers(self):
+        """Number of cells with numbers in this selection"""
+        return self.compute('COUNTNUMS')
+    def average(self):
+        """Average of numbers in this selection"""
+        return self.compute('AVERAGE')
+    def max(self):
+        """Greatest number in this selection"""
+        return self.compute('MAX')
+    def min(self):
+        """Smallest number in this selection"""
+        return self.compute('MIN')
+
+    def _field(self, column):
+        """Index of a column, given by name like 'B', relative to the first column of this selection"""
+        field = col_index(column) - self.start_col
+        assert 0 <= field < self.width, "Column %s is not in %s" % (column, self.selector)
+        return field
+
+    def sort(self, by = None, has_header = False, case_sensitive = False):
+        """
+        Sorts the rows of this selection inside LibreOffice. "by" is a list of columns, each given
+        either by its name, like 'B', or by a (name, descending) tuple, like ('B', True).
+        Rows are sorted by the first column if "by" is not given. If "has_header" is True, the first
+        row is kept in place.
+        """
+        if by is None:
+            by = [ col_name(self.start_col) ]
+
+        fields = []
+        for column in by:
+            if type(column) not in (types.TupleType, types.ListType):
+                column = (column, False)
+            field = uno.createUnoStruct('com.sun.star.table.TableSortField')
+            field.Field = self._field(column[0])
+            field.IsAscending = not column[1]
+            field.IsCaseSensitive = case_sensitive
+            fields.append(field)
+
+        descriptor = self.args(None,
+                               ('SortFields', uno.Any('[]com.sun.star.table.TableSortField', tuple(fields))),
+                               ('ContainsHeader', has_header),
+                               ('IsSortColumns', False),
+                               )
+        uno.invoke(self.cell_range, 'sort', (descriptor,))
+        self._invalidate()
+        return self
+
+    # Operators of filter() conditions, as com.sun.star.sheet.FilterOperator values
+    _filter_operators = {
+        '==': 'EQUAL',
+        '!=': 'NOT_EQUAL',
+        '>': 'GREATER',
+        '>=': 'GREATER_EQUAL',
+        '<': 'LESS',
+        '<=': 'LESS_EQUAL',
+        }
+
+    def filter(self, conditions, has_header = True, connection = 'and'):
+        """
+        Hides the rows of this selection that don't match the conditions, inside LibreOffice.
+        Conditions are a list of (column, operator, value) tuples, like ('B', '>=', 10), with column
+        given by name and operator one of ==, !=, >, >=, < and <=. Value may be a number or a string,
+        or None to match empty cells with == or non-empty cells with !=.
+        Conditions are combined with "connection", either 'and' or 'or'.
+        If "has_header" is True, the first row is not filtered.
+        """
+        assert connection in ('and', 'or')
+
+        fields = []
+        for column, operator, value in conditions:
+            assert operator in self._filter_operators
+            field = uno.createUnoStruct('com.sun.star.sheet.TableFilterField')
+            field.Connection = uno.Enum('com.sun.star.sheet.FilterConnection', connection.upper())
+            field.Field = self._field(column)
+            if value is None:
+                assert operator in ('==', '!=')
+                operator = { '==': 'EMPTY', '!=': 'NOT_EMPTY' }[operator]
+            else:
+                operator = self._filter_operators[operator]
+                field.IsNumeric = type(value) not in (types.StringType, types.UnicodeType)
+                if field.IsNumeric:
+                    field.NumericValue = float(value)
+                else:
+                    field.StringValue = value
+            field.Operator = uno.Enum('com.sun.star.sheet.FilterOperator', operator)
+            fields.append(field)
+
+        cell_range = self.cell_range
+        descriptor = cell_range.createFilterDescriptor(True)
+        descriptor.ContainsHeader = has_header
+        descriptor.setFilterFields(tuple(fields))
+        cell_range.filter(descriptor)
+        self._invalidate() # formulas like SUBTOTAL depend on visible rows
+        return self
+
+    def unfilter(self):
+        """Shows again all rows hidden by filter()"""
+        return self.filter([])
+
+    def group_by(self, keys, aggregates, destiny, totals = False):
+        """
+        Summarizes this selection inside LibreOffice, by creating a DataPilot (pivot) table at destiny.
+        First row of selection must have the column labels.
+        "keys" is a list of columns to group rows by, given by name like 'A', and "aggregates" a list of
+        (column, function) tuples, like ('C', 'sum'), with any function accepted by compute().
+        Each column can be aggregated only once, and not if it's a key, as a DataPilot field can't be
+        both: to count rows per key, count another column that is never empty.
+        If "totals" is True, a row with grand totals is added.
+        Destiny is an OOSheet object or selector, possibly in another sheet, of which only the top
+        left corner is considered.
+
+        Returns an OOSheet object with the resulting table, whose data_array can be read.
+        The DataPilot table is kept in document, and is updated by LibreOffice when data changes.
+        """
+        assert self.height > 1, "First row must have column labels"
+        aggregated = set([ col_index(column) for column, function in aggregates ])
+        assert len(aggregated) == len(aggregates), "Each column can be aggregated only once"
+        keys_aggregated = set([ col_index(column) for column in keys ]) & aggregated
+        assert not keys_aggregated, "Key columns can't be aggregated: %s" % \
+            ', '.join([ col_name(column) for column in sorted(keys_aggregated) ])
+
+        if type(destiny) is not type(self):
+            destiny = OOSheet(destiny)
+
+        tables = destiny.sheet.getDataPilotTables()
+        descriptor = tables.createDataPilotDescriptor()
+        descriptor.setSourceRange(self.cell_range.getRangeAddress())
+        descriptor.ShowFilterButton = False
+        descriptor.RowGrand = totals
+        descriptor.ColumnGrand = totals
+
+        fields = descriptor.getDataPilotFields()
+        orientation = lambda name: uno.Enum('com.sun.star.sheet.DataPilotFieldOrientation', name)
+        for column in keys:
+            fields.getByIndex(self._field(column)).Orientation = orientation('ROW')
+        for column, function in aggregates:
+            field = fields.getByIndex(self._field(column))
+            field.Orientation = orientation('DATA')
+            field.Function = uno.Enum('com.sun.star.sheet.GeneralFunction', function.upper())
+
+        number = 1
+        while tables.hasByName('OOSheet%d' % number):
+            number += 1
+        name = 'OOSheet%d' % number
+
+        address = destiny.sheet.getCellByPosition(destiny.start_col, destiny.start_row).getCellAddress()
+        tables.insertNewByName(name, address, descriptor)
+
+        result = destiny._derive_from_address(tables.getByName(name).getOutputRange())
+        result._invalidate()
+        return result
+
     def shift_right(self, num = 1):
         """Moves the selector to right, but number of columns given by "num" parameter."""
         return self.shift(num, 0)
@@ -722,6 +1762,85 @@ class OOSheet(OODoc):
 
         # value is None
         return cell.getValue() == 0 and cell.getString() == '' and cell.getFormula() == ''
+
+    def _steps_until(self, ref_col, ref_row, col, row, value):
+        """
+        Number of steps in direction given by "col" and "row" from cell at (ref_col, ref_row)
+        until a cell matching value is found, with same rules as _cell_matches().
+
+        Strings are searched inside LibreOffice. For other values the scanned row or column
+        is fetched in chunks, starting small and growing up to block_cells, and matched locally.
+        Raises AssertionError if border of sheet is reached.
+        """
+        assert type(value) in (types.NoneType, types.StringType, types.UnicodeType,
+                               types.FloatType, types.IntType, types.LongType, datetime)
+
+        if abs(col) + abs(row) != 1:
+            cell = self._derive(ref_col, ref_col, ref_row, ref_row)
+            steps = 0
+            while not cell._cell_matches(cell.cell, value):
+                cell.shift(col, row)
+                steps += 1
+            return steps
+
+        if col:
+            line_range = lambda start, end: self.sheet.getCellRangeByPosition(start, ref_row, end, ref_row)
+            position, direction = ref_col, col
+            last = self.sheet.Columns.getCount() - 1 if col > 0 else 0
+        else:
+            line_range = lambda start, end: self.sheet.getCellRangeByPosition(ref_col, start, ref_col, end)
+            position, direction = ref_row, row
+            last = self.sheet.Rows.getCount() - 1 if row > 0 else 0
+
+        assert (last - position) * direction >= 0
+
+        if type(value) in (types.StringType, types.UnicodeType) and value:
+            cell_range = line_range(min(position, last), max(position, last))
+            found = cell_range.findFirst(self._search_descriptor(cell_range, value, direction < 0))
+            assert found is not None
+            address = found.getCellAddress()
+            if col:
+                return abs(address.Column - position)
+            return abs(address.Row - position)
+
+        if value is None:
+            # Only empty cells have an empty formula
+            fetch = lambda cell_range: cell_range.getFormulaArray()
+            test = lambda data: data == u''
+        elif type(value) in (types.StringType, types.UnicodeType):
+            fetch = lambda cell_range: cell_range.getDataArray()
+            test = lambda data: data == u''
+        else:
+            if type(value) is datetime:
+                value = (value - self.basedate).days
+            fetch = lambda cell_range: cell_range.getDataArray()
+            # strings and empty cells have value 0
+            test = lambda data: (data if type(data) is types.FloatType else 0) == value
+
+        steps = 0
+        chunk = 32
+        while (last - position) * direction >= 0:
+            end = position + direction * (chunk - 1)
+            if (end - last) * direction > 0:
+                end = last
+
+            data = fetch(line_range(min(position, end), max(position, end)))
+            if col:
+                data = list(data[0])
+            else:
+                data = [ cell_data[0] for cell_data in data ]
+            if direction < 0:
+                data.reverse()
+
+            for i, cell_data in enumerate(data):
+                if test(cell_data):
+                    return steps + i
+
+            steps += len(data)
+            position = end + direction
+            chunk = min(chunk * 2, self.block_cells)
+
+        raise AssertionError('No cell matching %r' % (value,))
         
     def shift_until(self, col, row, *args, **kwargs):
         """
@@ -748,14 +1867,10 @@ class OOSheet(OODoc):
         
         assert col != 0 or row != 0
         
-        try:
-            value = args[0]
-            assert self.cell is not None
-            while not self._cell_matches(self.cell, value):
-                self.shift(col, row)
-            return self
-        except IndexError:
-            pass
+        if args:
+            assert self._single_cell
+            steps = self._steps_until(self.start_col, self.start_row, col, row, args[0])
+            return self.shift(col * steps, row * steps)
 
         assert len(kwargs.keys()) == 1
         ref = kwargs.keys()[0]
@@ -763,11 +1878,6 @@ class OOSheet(OODoc):
 
         reftype, position = ref.split('_')[:2]
 
-        if ref.endswith('_satisfies'):
-            condition = value
-        else:
-            condition = lambda s: s._cell_matches(s.cell, value)
-
         assert reftype in ('row', 'column')
 
         if reftype == 'row':
@@ -785,12 +1895,16 @@ class OOSheet(OODoc):
             else:
                 ref_row = self.start_row
 
-        cell = OOSheet(self._generate_selector(ref_col, ref_col, ref_row, ref_row))
-        while not condition(cell):
+        if not ref.endswith('_satisfies'):
+            steps = self._steps_until(ref_col, ref_row, col, row, value)
+            return self.shift(col * steps, row * steps)
+
+        cell = self._derive(ref_col, ref_col, ref_row, ref_row)
+        while not value(cell):
             self.shift(col, row)
             cell.shift(col, row)
 
-        return self            
+        return self
 
     def shift_right_until(self, *args, **kwargs):
         """Moves selector to right until condition is matched. See shift_until()"""
@@ -909,8 +2023,9 @@ class OOSheet(OODoc):
         """
         Returns a clone of this selector.
         Useful to preserve a state before calls that modify the selector.
+        Uno is not touched, the clone shares the sheet object of this selector.
         """
-        return OOSheet(self.selector)
+        return self._derive(self.start_col, self.end_col, self.start_row, self.end_row)
 
     def protect_sheet(self, password = ""):
         """
@@ -930,19 +2045,413 @@ class OOSheet(OODoc):
         self.sheet.unprotect(password)
         return self
 
+    def _set_locked(self, locked):
+        """
+        Sets the Locked flag of cell protection in all cells of this selection, keeping the other flags.
+        Cells are grouped by getCellFormatRanges(), and the ones with same other flags are set with
+        one property set, so this takes few calls no matter the size of selection.
+        """
+        format_ranges = self.cell_range.getCellFormatRanges()
+        groups = {}
+        for i in range(format_ranges.getCount()):
+            format_range = format_ranges.getByIndex(i)
+            protection = format_range.CellProtection
+            if protection.IsLocked == locked:
+                continue
+            flags = (protection.IsFormulaHidden, protection.IsHidden, protection.IsPrintHidden)
+            groups.setdefault(flags, []).append(format_range.getRangeAddress())
+
+        for (formula_hidden, hidden, print_hidden), addresses in groups.items():
+            protection = uno.createUnoStruct('com.sun.star.util.CellProtection')
+            protection.IsLocked = locked
+            protection.IsFormulaHidden = formula_hidden
+            protection.IsHidden = hidden
+            protection.IsPrintHidden = print_hidden
+
+            ranges = self.model.createInstance("com.sun.star.sheet.SheetCellRanges")
+            ranges.addRangeAddresses(tuple(addresses), False)
+            ranges.CellProtection = protection
+        return self
+
     def protect(self):
         """Protects selection's cells against edition. Only in effect when sheet is protected"""
-        self.focus()
-        self.dispatch('Protection', ('Protection.Locked', True))
-        return self
+        return self._set_locked(True)
     
     def unprotect(self):
         """Unprotects selections's cell against edition."""
-        self.focus()
-        self.dispatch('Protection', ('Protection.Locked', False))
-        return self
+        return self._set_locked(False)
     
 
+class OOSheetWriter(object):
+    """
+    Writes rows of data to a spreadsheet, one at a time, starting at the first row of
+    a selector. Rows are buffered and written in blocks of "buffer_size" rows with
+    setDataArray(), so appending a large amount of data takes few Uno calls.
+
+    If "insert" is True, rows are inserted before writing, so that cells below are
+    shifted down instead of overwritten.
+
+    Buffered rows are written by flush() or close(), which is called automatically when
+    writer is used as a context manager:
+
+    >>> with S('a10:c10').writer() as writer:
+    >>>     for row in rows:
+    >>>         writer.write(row)
+    """
+
+    def __init__(self, anchor, buffer_size = 1000, insert = False):
+        assert buffer_size > 0
+        self.anchor = anchor.first_row
+        self.buffer_size = buffer_size
+        self.insert = insert
+        self.buffer = []
+        self.rows_written = 0
+
+    def write(self, row):
+        """Adds one row of data. Expects a sequence with the width of the anchor selector."""
+        row = tuple(row)
+        assert len(row) == self.anchor.width
+        self.buffer.append(row)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def writerows(self, rows):
+        """Adds several rows of data. See write()"""
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        """Writes all buffered rows to the spreadsheet"""
+        if not self.buffer:
+            return
+
+        start_row = self.anchor.start_row + self.rows_written
+        target = self.anchor._derive(self.anchor.start_col, self.anchor.end_col,
+                                     start_row, start_row + len(self.buffer) - 1)
+        if self.insert:
+            target.first_row.insert_rows(len(self.buffer))
+
+        target.data_array = self.buffer
+        self.rows_written += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        """Writes the remaining buffered rows. Same as flush()"""
+        self.flush()
+
+    @property
+    def selection(self):
+        """
+        An OOSheet object with all rows written so far, or None if no rows have been written yet.
+        Buffered rows are not included until flushed.
+        """
+        if not self.rows_written:
+            return None
+        return self.anchor.clone().grow_down(self.rows_written - 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class OOSheetSnapshot(object):
+    """
+    A local copy of the data of a selection, read at once with getDataArray().
+
+    Data can be read and modified with index syntax, by row and column relative to the selection,
+    either as snapshot[row][col] or snapshot[row, col]. Nothing is sent to LibreOffice until commit(),
+    which writes only the cells that changed, grouped in as few rectangles as possible, each one
+    written with one setDataArray() call.
+
+    When used as a context manager, changes are committed at the end unless an exception is raised:
+
+    >>> with S('a1:z1000').snapshot() as data:
+    >>>     data[10, 2] = 'changed'
+    """
+
+    def __init__(self, source):
+        self.source = source.clone()
+        self.reload()
+
+    def reload(self):
+        """Reads the data again from the spreadsheet, discarding uncommitted changes"""
+        self.original = self.source.data_array
+        self.data = [ list(row) for row in self.original ]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __getitem__(self, key):
+        if type(key) is types.TupleType:
+            row, col = key
+            return self.data[row][col]
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        if type(key) is types.TupleType:
+            row, col = key
+            self.data[row][col] = value
+        else:
+            value = list(value)
+            assert len(value) == self.source.width
+            self.data[key] = value
+
+    @property
+    def changes(self):
+        """A list of (row, col) positions, relative to selection, of cells changed since last commit"""
+        changes = []
+        for row, (original, current) in enumerate(zip(self.original, self.data)):
+            for col in xrange(len(original)):
+                if self.source._cell_data(current[col]) != original[col]:
+                    changes.append((row, col))
+        return changes
+
+    def _rectangles(self, changes):
+        """
+        Groups changed positions in rectangles (start_row, start_col, end_row, end_col). Contiguous
+        changed cells of each row are joined, and then equal column spans of consecutive rows.
+        """
+        spans = []
+        for row, col in changes:
+            if spans and spans[-1][0] == row and spans[-1][2] == col - 1:
+                spans[-1][2] = col
+            else:
+                spans.append([row, col, col])
+
+        open_rectangles = {}
+        rectangles = []
+        for row, start_col, end_col in spans:
+            rectangle = open_rectangles.get((start_col, end_col))
+            if rectangle is not None and rectangle[2] == row - 1:
+                rectangle[2] = row
+            else:
+                rectangle = [row, start_col, row, end_col]
+                open_rectangles[(start_col, end_col)] = rectangle
+                rectangles.append(rectangle)
+        return [ tuple(rectangle) for rectangle in rectangles ]
+
+    def commit(self):
+        """
+        Writes cells changed since last commit to the spreadsheet. Returns the number of
+        setDataArray() calls done.
+        """
+        rectangles = self._rectangles(self.changes)
+        source = self.source
+        for start_row, start_col, end_row, end_col in rectangles:
+            data = [ [ source._cell_data(cell_data) for cell_data in row[start_col:end_col+1] ]
+                     for row in self.data[start_row:end_row+1] ]
+            target = source._derive(source.start_col + start_col, source.start_col + end_col,
+                                    source.start_row + start_row, source.start_row + end_row)
+            target.data_array = data
+
+        self.original = tuple([ tuple([ source._cell_data(cell_data) for cell_data in row ])
+                                for row in self.data ])
+        return len(rectangles)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+class OOChangeFeed(object):
+    """
+    Records ranges of cells changed in a document, no matter who changed them, so that incremental
+    jobs can reprocess only what's been modified. Obtained with OOSheet.watch_changes().
+
+    Changes are notified by LibreOffice through a com.sun.star.util.XChangesListener. If document
+    does not support it, a com.sun.star.util.XModifyListener is used, and then changed ranges are
+    not known.
+    """
+
+    # Operations that only change cells, so the sheets are kept
+    _cell_operations = ('cell-change', 'insert-rows', 'insert-columns', 'delete-rows', 'delete-columns')
+
+    def __init__(self, model):
+        self.model = model
+        self.pending = deque()
+        self.listener = _ChangesListener(self)
+        try:
+            model.addChangesListener(self.listener)
+            self.precise = True
+        except AttributeError:
+            model.addModifyListener(self.listener)
+            self.precise = False
+
+    def record(self, operation, address = None):
+        """
+        Records a change, given the operation name (like "cell-change" or "insert-rows") and
+        a com.sun.star.table.CellRangeAddress, or None if range is unknown.
+        Cache of cells is invalidated accordingly. Any other operation, or an unknown one, may have
+        renamed, removed or moved sheets, so cached sheet objects are forgotten.
+        """
+        self.pending.append((operation, address))
+
+        if operation not in self._cell_operations:
+            OODoc._sheets = {}
+
+        cache = OODoc._cell_cache
+        if cache is not None:
+            if operation == 'cell-change' and address is not None:
+                cache.invalidate_later(address.StartColumn, address.EndColumn,
+                                       address.StartRow, address.EndRow)
+            else:
+                cache.invalidate_later()
+
+    def take(self):
+        """
+        Returns the changes recorded since last call, as a list of (operation, OOSheet) tuples,
+        in order they happened. OOSheet is None if range is unknown.
+        """
+        changes = []
+        sheets = {}
+        while self.pending:
+            operation, address = self.pending.popleft()
+            selection = None
+            if address is not None:
+                if address.Sheet not in sheets:
+                    name = self.model.Sheets.getByIndex(address.Sheet).Name
+                    sheets[address.Sheet] = OOSheet('%s.A1' % name)
+                selection = sheets[address.Sheet]._derive_from_address(address)
+            changes.append((operation, selection))
+        return changes
+
+    def close(self):
+        """Stops listening to changes"""
+        if self.precise:
+            self.model.removeChangesListener(self.listener)
+        else:
+            self.model.removeModifyListener(self.listener)
+
+class _ChangesListener(unohelper.Base, XChangesListener, XModifyListener):
+    """Receives changes notified by LibreOffice and records them in an OOChangeFeed"""
+
+    def __init__(self, feed):
+        self.feed = feed
+
+    def changesOccurred(self, event):
+        for change in event.Changes:
+            operation = change.Accessor
+            addresses = None
+            for element in (change.ReplacedElement, change.Element):
+                try:
+                    addresses = element.getRangeAddresses()
+                    break
+                except AttributeError:
+                    pass
+
+            if addresses is None:
+                self.feed.record(operation)
+            for address in addresses or ():
+                self.feed.record(operation, address)
+
+    def modified(self, event):
+        self.feed.record('modified')
+
+    def disposing(self, event):
+        pass
+
+class OOBulkEdit(object):
+    """
+    Suspends repainting, recalculation and undo recording of a document during a batch of edits,
+    as a context manager. Obtained with OODoc.bulk().
+
+    On exit, even if an exception was raised, everything is restored and, if automatic calculation
+    was enabled, all formulas are recalculated once. Inside the block formulas are not recalculated,
+    so their values must not be relied on. Sessions can be nested.
+    """
+
+    def __init__(self, model, undo = True, title = u'OOSheet'):
+        self.model = model
+        self.undo = undo
+        self.title = title
+        self.calculating = None
+        # functions restoring what's been suspended, in order they were suspended
+        self.restore = []
+
+    def __enter__(self):
+        model = self.model
+        restore = self.restore = []
+        try:
+            model.lockControllers()
+            restore.append(model.unlockControllers)
+
+            model.addActionLock()
+            restore.append(model.removeActionLock)
+
+            self.calculating = model.isAutomaticCalculationEnabled()
+            model.enableAutomaticCalculation(False)
+            restore.append(self._restore_calculation)
+
+            undo_manager = model.getUndoManager()
+            if self.undo:
+                undo_manager.enterUndoContext(self.title)
+                restore.append(undo_manager.leaveUndoContext)
+            else:
+                undo_manager.lock()
+                restore.append(undo_manager.unlock)
+        except:
+            self._restore()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self._restore()
+        finally:
+            # formulas have been recalculated
+            if OODoc._cell_cache is not None:
+                OODoc._cell_cache.invalidate()
+
+    def _restore_calculation(self):
+        self.model.enableAutomaticCalculation(self.calculating)
+        if self.calculating:
+            self.model.calculateAll()
+
+    def _restore(self):
+        """
+        Restores everything suspended, in reverse order. Each step is done even if previous ones fail,
+        and then the last error is raised.
+        """
+        if not self.restore:
+            return
+        step = self.restore.pop()
+        try:
+            step()
+        finally:
+            self._restore()
+
+class _Prefetcher(threading.Thread):
+    """
+    Runs a function in background as soon as it's created. The result is obtained
+    with get(), which waits for the function to finish and reraises its exceptions.
+    """
+    def __init__(self, function, *args):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.function = function
+        self.args = args
+        self.result = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.result = self.function(*self.args)
+        except Exception:
+            self.error = sys.exc_info()
+
+    def get(self):
+        self.join()
+        if self.error:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.result
+
 class OOPacker():
     """
     This class manipulates a document in OpenDocument format (the one used by OpenOffice.org)
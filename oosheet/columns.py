@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
-import sys
+import sys, re
 
-def index(name):
+# Number of columns in a LibreOffice Calc sheet, from A to XFD
+max_columns = 16384
+
+def _index(name):
     letters = [ l for l in name.upper() ]
     letters.reverse()
     index = 0
@@ -12,7 +15,7 @@ def index(name):
         power += 1
     return index - 1
 
-def name(index):
+def _name(index):
     name = []
     letters = [ chr(ord('A')+i) for i in range(26) ]
 
@@ -27,6 +30,33 @@ def name(index):
     name.reverse()
     return ''.join(name)            
 
+_names = [ _name(i) for i in range(max_columns) ]
+_indexes = dict([ (n, i) for i, n in enumerate(_names) ])
+_indexes.update([ (n.lower(), i) for i, n in enumerate(_names) ])
+
+_address = re.compile('^([A-Za-z]+)([0-9]+)$')
+
+def index(name):
+    """Converts a column name, like "AB", to its zero-based index"""
+    try:
+        return _indexes[name]
+    except KeyError:
+        return _index(name)
+
+def name(index):
+    """Converts a zero-based column index to its name, like "AB" """
+    if 0 <= index < max_columns:
+        return _names[index]
+    return _name(index)
+
+def position(address):
+    """Converts a cell address, like "AB123", to a tuple of zero-based column and row indexes"""
+    match = _address.match(address)
+    if match is None:
+        raise ValueError('Invalid cell address: %s' % address)
+    col, row = match.groups()
+    return index(col), int(row) - 1
+
 class Wrapper(object):
     def __init__(self, wrapped):
         self.wrapped = wrapped
@@ -39,4 +69,3 @@ class Wrapper(object):
             return name
 
 sys.modules[__name__] = Wrapper(sys.modules[__name__])
-            
@@ -0,0 +1,149 @@
+#!/usr/bin/python
+
+"""
+Rough benchmarks for OOSheet operations that talk to LibreOffice through the socket bridge.
+
+Launch LibreOffice first (see oosheet-launch), with an empty spreadsheet, and then:
+
+  $ python oosheet/tests/benchmark.py
+
+Each benchmark compares the naive per-cell path with the bulk path used by OOSheet.
+Sheet1 is used as scratch area and is cleared between benchmarks.
+"""
+
+import sys, time
+from datetime import datetime, timedelta
+
+from oosheet import OOSheet as S, columns
+
+def clear(rows = 1000):
+    S('a1:z%d' % rows).delete()
+
+def report(name, cells, seconds):
+    print '%-40s %8d cells %8.3fs %12.0f cells/sec' % (name, cells, seconds, cells / max(seconds, 1e-6))
+
+def timed(function):
+    start = time.time()
+    function()
+    return time.time() - start
+
+def per_cell_set_value(selector, value):
+    for cell in S(selector)._cells:
+        cell.setValue(value)
+
+def per_cell_set_string(selector, string):
+    for cell in S(selector)._cells:
+        cell.setString(string)
+
+def per_cell_set_formula(selector, formula):
+    for cell in S(selector)._cells:
+        cell.setFormula(formula)
+
+def bench_setters(rows):
+    selector = 'a1:j%d' % rows
+    cells = S(selector).width * S(selector).height
+
+    clear(rows)
+    report('value, per cell', cells, timed(lambda: per_cell_set_value(selector, 5)))
+    clear(rows)
+    report('value, bulk', cells, timed(lambda: S(selector).set_value(5)))
+
+    clear(rows)
+    report('string, per cell', cells, timed(lambda: per_cell_set_string(selector, u'hello')))
+    clear(rows)
+    report('string, bulk', cells, timed(lambda: S(selector).set_string(u'hello')))
+
+    clear(rows)
+    report('formula, per cell', cells, timed(lambda: per_cell_set_formula(selector, u'=1+1')))
+    clear(rows)
+    report('formula, bulk', cells, timed(lambda: S(selector).set_formula(u'=1+1')))
+
+def per_selector_cells(selector):
+    base = S(selector)
+    for col in range(base.start_col, base.end_col+1):
+        for row in range(base.start_row, base.end_row+1):
+            S(base._generate_selector(col, col, row, row))
+
+def bench_iteration(rows):
+    selector = 'a1:j%d' % rows
+    cells = S(selector).width * S(selector).height
+
+    report('cells, parsing selectors', cells, timed(lambda: per_selector_cells(selector)))
+    report('cells, from coordinates', cells, timed(lambda: [ c for c in S(selector).cells ]))
+
+def bench_shift_until(rows):
+    S('a1:a%d' % rows).value = 1
+
+    report('shift_until, per cell', rows,
+           timed(lambda: S('a1:b1').shift_down_until(column_a_satisfies = lambda c: c.string == '')))
+    report('shift_until, chunked', rows,
+           timed(lambda: S('a1:b1').shift_down_until(column_a = None)))
+
+    clear(rows)
+
+def selector(sheet_name, col, row):
+    # same formatting as OOSheet._generate_selector(), with sheet name given
+    return '%s.%s%d' % (sheet_name, columns.name(col), row + 1)
+
+def bench_selectors(rows):
+    # Only column tables and string handling are measured, LibreOffice is not called
+    cells = rows * 100
+    positions = [ (i % columns.max_columns, i) for i in range(cells) ]
+    addresses = [ selector('Sheet1', col, row).split('.')[1] for col, row in positions ]
+
+    report('selector generation', cells,
+           timed(lambda: [ selector('Sheet1', col, row) for col, row in positions ]))
+    report('address parsing', cells,
+           timed(lambda: [ columns.position(address) for address in addresses ]))
+    report('column name to index', cells,
+           timed(lambda: [ columns.index(address.rstrip('0123456789')) for address in addresses ]))
+
+def bench_dates(rows):
+    selector = 'a1:a%d' % rows
+    dates = [ (datetime(2011, 1, 1) + timedelta(i),) for i in range(rows) ]
+
+    clear(rows)
+    report('dates, per cell', rows,
+           timed(lambda: [ cell.set_date(dates[i][0]) for i, cell in enumerate(S(selector).cells) ]))
+    clear(rows)
+    report('dates, dates_array', rows, timed(lambda: setattr(S(selector), 'dates_array', dates)))
+    report('dates, reading per cell', rows, timed(lambda: [ cell.date for cell in S(selector).cells ]))
+    report('dates, reading dates_array', rows, timed(lambda: S(selector).dates_array))
+    clear(rows)
+
+def dispatch_autofill(selector, destiny):
+    base = S(selector)
+    base.focus()
+    base.dispatch('AutoFill', ('EndCell', '%s.%s' % (base.sheet.Name, destiny)))
+
+def bench_drag_to(rows):
+    S('a1').value = 1
+    S('b1').formula = '=a1*2'
+
+    report('drag_to, dispatching AutoFill', rows * 2,
+           timed(lambda: dispatch_autofill('a1:b1', 'b%d' % rows)))
+    clear(rows)
+
+    S('a1').value = 1
+    S('b1').formula = '=a1*2'
+    report('drag_to, fillAuto', rows * 2, timed(lambda: S('a1:b1').drag_to('b%d' % rows)))
+    clear(rows)
+
+benchmarks = [
+    bench_setters,
+    bench_iteration,
+    bench_shift_until,
+    bench_selectors,
+    bench_dates,
+    bench_drag_to,
+    ]
+
+if __name__ == '__main__':
+    try:
+        rows = int(sys.argv[1])
+    except (IndexError, ValueError):
+        rows = 1000
+
+    for benchmark in benchmarks:
+        benchmark(rows)
+    clear(rows)
@@ -35,6 +35,68 @@ def test_column_name_vs_index_conversion():
     assert name(26) == 'AA'
     assert name(31) == 'AF'
 
+    assert index('XFD') == 16383
+    assert name(16383) == 'XFD'
+    assert index('xfe') == 16384
+    assert name(16384) == 'XFE'
+
+def test_cell_address_to_position_conversion():
+    from oosheet.columns import position
+
+    assert position('A1') == (0, 0)
+    assert position('b3') == (1, 2)
+    assert position('AB123') == (27, 122)
+    assert position('XFD1048576') == (16383, 1048575)
+
+    try:
+        position('1A')
+        assert False
+    except ValueError:
+        pass
+
+def test_bounded_cache():
+    from oosheet import _BoundedCache
+
+    cache = _BoundedCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('b', 3)
+    assert len(cache) == 2
+    assert cache.get('b') == 3
+
+    cache.put('c', 4)
+    assert len(cache) == 1
+    assert cache.get('a') is None
+    assert cache.get('c') == 4
+
+def test_selector_parsing_is_memoized():
+    S('Sheet2.b2:c3')
+    assert S('a1')._parsed_selectors.get('Sheet2.b2:c3') == ('Sheet2', 1, 2, 1, 2)
+    assert S('Sheet2.$B$2').selector == 'Sheet2.B2'
+    assert S('a1:3') == S('A1:A3')
+
+def test_sheet_cache_can_be_cleared():
+    S('Sheet2.a1').value = 3
+    S('Sheet2.a1').sheet.Name = 'Renamed'
+    try:
+        assert S('Renamed.a1').value == 3
+
+        S().clear_sheet_cache()
+        try:
+            S('Sheet2.a1')
+            assert False
+        except AssertionError:
+            raise
+        except Exception:
+            pass
+    finally:
+        S('Renamed.a1').sheet.Name = 'Sheet2'
+        S().clear_sheet_cache()
+
+    assert S('Sheet2.a1').value == 3
+    S('Sheet2.a1').delete()
+
 def test_value():
     S('a1').value = 10
 
@@ -83,6 +145,26 @@ def test_date_only_sets_format_if_not_already_in_date_format():
     # Now format must have been set
     assert '/' in S('a3').string
 
+def test_dates_array():
+    S('a1:b2').dates_array = ((datetime(2011, 1, 20), datetime(2011, 1, 21, 12)),
+                              (None, datetime(2011, 2, 1)))
+
+    assert S('a1').date == datetime(2011, 1, 20)
+    assert S('b1').value == S('a1').value + 1.5
+    assert S('a2').string == ''
+    assert '/' in S('b2').string
+
+    assert S('a1:b2').dates_array == ((datetime(2011, 1, 20), datetime(2011, 1, 21, 12)),
+                                      (None, datetime(2011, 2, 1)))
+
+def test_dates_array_keeps_date_formats():
+    S().sheet.getCellRangeByName('Sheet1.A1').NumberFormat = 38
+
+    S('a1:a2').dates_array = ((datetime(2011, 2, 20),), (datetime(2011, 2, 20),))
+
+    assert S('a1').string in (u'Sunday, February 20, 2011', u'Domingo, 20 de Fevereiro de 2011')
+    assert '/' in S('a2').string
+
 def test_equals():
     assert S('a1:g10') == S('a1:g10')
     assert S('A1:G10') == S('a1:g10')
@@ -121,6 +203,19 @@ def test_data_of_multiple_cells_can_be_changed():
     assert S('h11').value == 0
     assert S('g10').value == 17
 
+def test_multiple_cells_setters_keep_types():
+    S('a1:b3').string = u'10'
+    assert S('a1').formula == u"'10"
+    assert S('b3').formula == u"'10"
+    assert S('b3').value == 0
+
+    S('a1:b3').value = 7
+    assert S('a3').string == u'7'
+    assert S('b1').formula == u'7'
+
+    S('a1:b3').formula = 'c1'
+    assert S('b2').formula == u'=C1'
+
 def test_selection_has_width_and_height():
     assert S('a1').width == 1
     assert S('a1').height == 1
@@ -166,6 +261,22 @@ def test_drag_calls_can_be_cascaded():
     S('a1').drag_to('a5').drag_to('c5')
     assert S('c5').value == 7
 
+def test_drag_to_other_directions():
+    S('c3').value = 5
+    S('c4').value = 6
+
+    assert S('c3:c4').drag_to('c1').selector == 'Sheet1.C1:C4'
+    assert S('c1').value == 3
+
+    S('e1').string = 'hello'
+    assert S('e1').drag_to(S('a1')).selector == 'Sheet1.A1:E1'
+    assert S('a1').string == 'hello'
+
+def test_drag_to_keeps_selection_inside():
+    S('a1').value = 1
+    assert S('a1:b2').drag_to('a2').selector == 'Sheet1.A1:B2'
+    assert S('a2').value == 0
+
 def test_selector_handles_sheets():
     """This test requires english OpenOffice"""
     S('a1').value = 2
@@ -210,6 +321,27 @@ def test_last_rows_and_columns():
     assert S('a1:g10').first_column == S('A1:A10')
     assert S('a1:g10').last_column == S('G1:G10')
 
+def test_used_range():
+    S('b3').value = 1
+    S('d7').string = 'hello'
+
+    assert S('a1').used_range == S('b3:d7')
+    assert S('Sheet2.a1').used_range == S('Sheet2.a1')
+
+def test_current_region_and_end_of_data():
+    S('a1:c10').value = 1
+    S('e1:e20').value = 2
+
+    assert S('b4').current_region == S('a1:c10')
+    assert S('a1:b1').end_of_data == S('a11:b11')
+    assert S('e5').end_of_data == S('e21')
+
+def test_end_of_data_in_empty_sheet():
+    assert S('a1').end_of_data == S('a1')
+    assert S('b3:c5').end_of_data == S('b3:c3')
+    S('b3').value = 1
+    assert S('b3:c5').end_of_data == S('b6:c6')
+
 def test_insert_rows():
     S('a1').value = 10
     S('b2').formula = '=a1+5'
@@ -244,6 +376,19 @@ def test_several_rows_can_be_inserted():
     assert S('b7').value == 5
     
 
+def test_rows_can_be_inserted_and_deleted_in_other_sheets():
+    S('Sheet2.a1').value = 1
+    S('Sheet2.a2').value = 2
+
+    assert S('Sheet2.a2').insert_rows(1000) == S('Sheet2.a2:a1002')
+    assert S('Sheet2.a1002').value == 2
+    assert S('a1002').value == 0
+
+    S('Sheet2.b3:c1001').delete_rows()
+    assert S('Sheet2.a3').value == 2
+
+    S('Sheet2.a1:g10').delete()
+
 def test_insert_column():
     S('a1').value = 10
     S('b2').formula = '=a1+5'
@@ -319,6 +464,24 @@ def test_copy_cut_and_paste_can_be_cascaded():
     assert S('b2').value == 0
     assert S('a2').value == 18
 
+def test_copy_to_and_move_to():
+    S('a1').value = 4
+    S('a2').formula = '=a1*2'
+
+    copied = S('a1:a2').copy_to('c3')
+    assert copied.selector == 'Sheet1.C3:C4'
+    assert S('a1').value == 4
+    assert S('c3').value == 4
+    assert S('c4').formula == '=C3*2'
+
+    moved = S('c3:c4').move_to(S('Sheet2.b1:z100'))
+    assert moved.selector == 'Sheet2.B1:B2'
+    assert S('c3').string == ''
+    assert S('Sheet2.b1').value == 4
+    assert S('Sheet2.b2').value == 8
+
+    S('Sheet2.a1:g10').delete()
+
 def test_delete():
     S('a1').value = 10
     S('a1').delete()
@@ -436,6 +599,27 @@ def test_shift_until_accepts_none_for_empty_cell():
     assert S('a2:z2').shift_down_until(column_f = None) == S('A11:Z11')
     assert S('a2:z2').shift_down_until(column_g = None) == S('A10:Z10')
 
+def test_shift_until_scans_long_distances():
+    S('a1:a300').value = 1
+    S('a201').delete()
+    S('a250').string = 'end'
+    S('a280').value = 7
+
+    assert S('a1').shift_down_until(None) == S('A201')
+    assert S('a300').shift_up_until(None) == S('A201')
+    assert S('a1').shift_down_until('end') == S('A250')
+    assert S('a300').shift_up_until('end') == S('A250')
+    assert S('a1').shift_down_until(7) == S('A280')
+    assert S('b1:b3').shift_down_until(column_a = 7) == S('B278:B280')
+    assert S('a1:c1').grow_down_until(column_a = None) == S('A1:C201')
+    assert S('a1:c300').shrink_down_until(column_a = 'end') == S('A1:C250')
+
+    try:
+        S('a300').shift_up_until(5)
+        assert False
+    except AssertionError:
+        pass
+
 def test_shift_right():
     S('a1').set_value(1).drag_to('a10').drag_to('f10')
     S('c1').set_value(100).drag_to('c10')
@@ -555,6 +739,40 @@ def test_object_can_be_cloned():
     assert start == S('a1')
     assert end == S('b1')
 
+class UnoCallCounter(object):
+    """Stand-in for an Uno object, counting every access to the wrapped one"""
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+        self.calls = 0
+    def __getattr__(self, name):
+        self.calls += 1
+        return getattr(self.wrapped, name)
+
+def test_selector_arithmetic_does_not_touch_uno():
+    base = S('b2:g10')
+    sheet = base.sheet = UnoCallCounter(base.sheet)
+
+    coordinates = lambda s: (s.start_col, s.end_col, s.start_row, s.end_row)
+
+    assert coordinates(base.clone()) == (1, 6, 1, 9)
+    assert coordinates(base.clone().shift_right(2).shift_down()) == (3, 8, 2, 10)
+    assert coordinates(base + (1, 2)) == (2, 7, 3, 11)
+    assert coordinates(base - (1, 1)) == (0, 5, 0, 8)
+    assert base - (base + (2, 3)) == (-2, -3)
+    assert coordinates(base[1]) == (1, 6, 2, 2)
+    assert coordinates(base[1][2]) == (3, 3, 2, 2)
+    assert coordinates(base[1:3]['D':'E']) == (3, 4, 2, 4)
+    assert coordinates(base.first_row) == (1, 6, 1, 1)
+    assert coordinates(base.last_row) == (1, 6, 9, 9)
+    assert coordinates(base.first_column) == (1, 1, 1, 9)
+    assert coordinates(base.last_column) == (6, 6, 1, 9)
+    assert base.clone().sheet is sheet
+
+    assert sheet.calls == 0
+
+    base.clone().selector
+    assert sheet.calls == 1
+
 def test_flatten():
     S('a1').value = 5
     S('a2').formula = '=a1+3'
@@ -690,6 +908,49 @@ def test_format_as():
     S('a3').format_as(S('a1'))
     assert S('a3').string.split()[0] == weekday
 
+def test_copy_format_from():
+    source = S().sheet.getCellRangeByName('Sheet1.A1')
+    source.CellBackColor = 0xff0000
+    source.NumberFormat = 38
+    S().sheet.getCellRangeByName('Sheet1.B3').CharWeight = 150 # bold
+
+    S('a1:b3').date = datetime(2011, 03, 1)
+    S('b2:b3').copy_format_from('a1')
+
+    assert S('b2').string == S('a1').string
+    assert S('b3').string == S('a1').string
+    cell = S().sheet.getCellRangeByName('Sheet1.B3')
+    assert cell.CellBackColor == 0xff0000
+    assert cell.CharWeight == 100 # not in source, so back to default
+
+def test_protection_is_set_in_range():
+    cells = S().sheet.getCellRangeByName('Sheet1.A1:C3')
+    S('a1:c3').protect()
+    assert cells.CellProtection.IsLocked
+    S('a1:c3').unprotect()
+    assert not cells.CellProtection.IsLocked
+
+def test_protection_keeps_other_flags_of_each_cell():
+    sheet = S().sheet
+    hidden = sheet.getCellRangeByName('Sheet1.B2')
+    protection = hidden.CellProtection
+    protection.IsFormulaHidden = True
+    hidden.CellProtection = protection
+
+    S('a1:c3').unprotect()
+    S('a1:c3').protect()
+
+    assert hidden.CellProtection.IsLocked
+    assert hidden.CellProtection.IsFormulaHidden
+    other = sheet.getCellRangeByName('Sheet1.C3').CellProtection
+    assert other.IsLocked
+    assert not other.IsFormulaHidden
+
+    S('a1:c3').unprotect()
+    assert hidden.CellProtection.IsFormulaHidden
+    protection.IsFormulaHidden = False
+    hidden.CellProtection = protection
+
 def test_data_array():
     S('a1').value = 1
     S('a2').formula = '=a1 * 2'
@@ -704,6 +965,152 @@ def test_data_array():
     assert len(S('a1:c7').data_array[1]) == 3
     assert S('a1:d7').data_array[5][1] == 48
 
+def test_data_array_can_be_set():
+    S('a1:b2').data_array = ((1, 'hello'), [3.5, u'world'])
+
+    assert S('a1').value == 1
+    assert S('b1').string == 'hello'
+    assert S('a2').value == 3.5
+    assert S('b2').string == 'world'
+    assert S('a1:b2').data_array == ((1, u'hello'), (3.5, u'world'))
+
+    try:
+        S('a1:b2').data_array = ((1, 2),)
+        assert False
+    except AssertionError:
+        assert S('a2').value == 3.5
+
+def test_formula_array():
+    S('a1:a2').value = 3
+    S('b1:b2').formula_array = (('=a1*2',), ('=a2+a1',))
+
+    assert S('b1').value == 6
+    assert S('b2').value == 6
+    assert S('a1:b2').formula_array == ((u'3', u'=A1*2'), (u'3', u'=A2+A1'))
+
+    formulas = S('b1:b2').formula_array
+    S('c1:c2').formula_array = formulas
+    assert S('c2').formula == u'=A2+A1'
+
+def test_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return # NumPy is optional
+
+    S('a1:b2').data_array = ((1, 'text'), (3.5, ''))
+
+    array = S('a1:b2').to_numpy()
+    assert array.shape == (2, 2)
+    assert array[0][0] == 1
+    assert numpy.isnan(array[0][1])
+    assert numpy.isnan(array[1][1])
+
+    array = S('a1:b2').to_numpy(dtype = object)
+    assert array[0][1] == u'text'
+    assert numpy.isnan(array[1][1])
+
+    array = S('a1:a2').to_numpy(dtype = int)
+    assert array.dtype.kind == 'i'
+    assert array[1][0] == 3
+
+    try:
+        S('a1:b2').to_numpy(dtype = int)
+        assert False, "Should have raised ValueError"
+    except ValueError:
+        pass
+
+    result = S('d1').from_numpy(numpy.array([[1.5, numpy.nan, 3], [4, 5, 6]]))
+    assert result == S('d1:f2')
+    assert S('d1').value == 1.5
+    assert S('e1').string == ''
+    assert S('f2').value == 6
+
+    S('h1:h3').from_numpy(numpy.arange(3))
+    assert S('h3').value == 2
+
+    try:
+        S('a1:b2').from_numpy(numpy.zeros((3, 3)))
+        assert False
+    except AssertionError:
+        pass
+
+def test_iter_blocks():
+    data = [ (i, 'row %d' % i) for i in range(25) ]
+    S('a1:b25').data_array = data
+
+    blocks = [ block for block in S('a1:b25').iter_blocks(10) ]
+    assert [ len(block) for block in blocks ] == [10, 10, 5]
+    assert blocks[2][0] == (20, u'row 20')
+    assert sum(blocks, ()) == S('a1:b25').data_array
+
+    blocks = [ block for block in S('a1:b25').iter_blocks(10, prefetch = True) ]
+    assert sum(blocks, ()) == S('a1:b25').data_array
+
+    assert len([ block for block in S('a1:b25').iter_blocks() ]) == 1
+
+def test_iter_rows():
+    S('a1:b25').data_array = [ (i, 'row %d' % i) for i in range(25) ]
+
+    rows = [ row for row in S('a3:b25').iter_rows(4) ]
+    assert len(rows) == 23
+    assert rows[0] == (2, u'row 2')
+    assert rows[-1] == (24, u'row 24')
+
+    assert [ row for row in S('a3:b25').iter_rows(4, prefetch = True) ] == rows
+    assert [ row for row in S('b3:b25').iter_rows() ][5] == (u'row 7',)
+
+def test_writer():
+    writer = S('b2:c2').writer(buffer_size = 10)
+    for i in range(25):
+        writer.write((i, 'row %d' % i))
+
+    assert writer.selection == S('b2:c21')
+    assert S('b21').value == 19
+    assert S('b22').string == ''
+
+    writer.flush()
+    assert writer.selection == S('b2:c26')
+    assert S('c26').string == 'row 24'
+
+    try:
+        writer.write((1, 2, 3))
+        assert False
+    except AssertionError:
+        pass
+
+def test_writer_converts_none_and_booleans():
+    S('a1').value = 5
+
+    with S('a1:c1').writer() as writer:
+        writer.write((None, True, False))
+        writer.write((float('nan'), 'text', None))
+
+    assert S('a1').string == ''
+    assert S('b1').value == 1
+    assert S('c1').value == 0
+    assert S('c1').string != ''
+    assert S('a2').string == ''
+    assert S('c2').string == ''
+
+def test_writer_as_context_manager():
+    with S('a1:b5').writer() as writer:
+        writer.writerows([ (i, i * 2) for i in range(3) ])
+        assert S('b3').value == 0
+
+    assert S('b3').value == 4
+    assert S('a4').string == ''
+    assert writer.selection == S('a1:b3')
+
+def test_writer_can_insert_rows():
+    S('a3').string = 'total'
+
+    with S('a3:b3').writer(buffer_size = 2, insert = True) as writer:
+        writer.writerows([ (i, i) for i in range(5) ])
+
+    assert S('a7').value == 4
+    assert S('a8').string == 'total'
+
 def test_iterator():
     for cell in S('a1:10'):
         cell.value = 31
@@ -790,6 +1197,28 @@ def test_iterator_columns():
     assert S('a11').value == 0
     assert S('e11').value == 0
 
+def test_iterators_keep_sheet_and_are_independent():
+    cells = [ cell for cell in S('Sheet2.b2:c3').cells ]
+    assert cells == [ S('Sheet2.b2'), S('Sheet2.b3'), S('Sheet2.c2'), S('Sheet2.c3') ]
+
+    cells[0].shift_right()
+    assert cells[0] == S('Sheet2.c2')
+    assert cells[1] == S('Sheet2.b3')
+
+    cells[3].value = 5
+    assert S('Sheet2.c3').value == 5
+    assert S('c3').value == 0
+
+    rows = [ row for row in S('Sheet2.b2:c3').rows ]
+    assert rows[1] == S('Sheet2.b3:c3')
+    assert rows[1][1] == S('Sheet2.c3')
+
+    columns = [ col for col in S('Sheet2.b2:c3').columns ]
+    assert columns[1] == S('Sheet2.c2:c3')
+    assert columns[1][1] == S('Sheet2.c3')
+
+    S('Sheet2.a1:g10').delete()
+
 def test_dispatch():
     S('a1').value = 10
     S('a2').formula = '=a1+5'
@@ -822,6 +1251,38 @@ def test_find():
     assert result[2] == S('D1')
 
 
+def test_find_matches_whole_string_with_case():
+    S('a1').string = 'word'
+    S('a2').string = 'words'
+    S('b1').string = 'Word'
+    S('b2').string = 'a word'
+    S('c1').string = 'w.rd'
+    S('c2').string = 'word'
+
+    assert [ cell for cell in S('a1:c2').find('word') ] == [ S('a1'), S('c2') ]
+    assert [ cell for cell in S('a1:c2').find('w.rd') ] == [ S('c1') ]
+    assert [ cell for cell in S('a1:c2').find('nothing') ] == []
+    assert [ cell for cell in S('b1:c2').find('word') ] == [ S('c2') ]
+
+def test_find_number():
+    S('a1').value = 3
+    S('b2').value = 3
+    S('b3').formula = '=a1'
+    S('c1').string = '3'
+    S('c2').value = 3.5
+
+    assert [ cell for cell in S('a1:c3').find(3) ] == [ S('a1'), S('b2'), S('b3') ]
+    assert [ cell for cell in S('a1:c3').find(3.5) ] == [ S('c2') ]
+    assert [ cell for cell in S('a2:c3').find(3) ] == [ S('b2'), S('b3') ]
+
+def test_find_zero_and_empty_string():
+    S('a1').value = 3
+    S('a2').string = 'text'
+    S('b1').value = 0
+
+    assert [ cell for cell in S('a1:b2').find(0) ] == [ S('a2'), S('b1'), S('b2') ]
+    assert [ cell for cell in S('a1:b2').find('') ] == [ S('b2') ]
+
 def test_find_accepts_function_as_query():
     vals = 'there are several cells with single words in it'.split()
     for i, cell in enumerate(S('a1:d8').cells):
@@ -842,6 +1303,41 @@ def test_find_accepts_function_as_query():
     assert result[9] == S('D6')
     assert result[10] == S('D7')
 
+def test_find_with_function_reads_cells_in_blocks():
+    S('a1:b3').data_array = ((1, 2), (3, 4), ('a', ''))
+
+    assert [ cell for cell in S('a1:b3').find(lambda c: c.value > 1) ] == [ S('a2'), S('b1'), S('b2') ]
+    assert S().cell_cache is None
+
+    cache = S().enable_cache().cell_cache
+    try:
+        assert [ cell for cell in S('a1:b3').find(lambda c: c.value == 3) ] == [ S('a2') ]
+        assert cache.misses == 1
+    finally:
+        S().disable_cache()
+
+def test_find_is_lazy():
+    S('a1:c2').value = 1
+    S('b1').value = 2
+    S('c2').value = True
+
+    calls = []
+    def predicate(cell):
+        calls.append(cell)
+        return cell.value == 1
+
+    original = S.block_cells
+    S.block_cells = 2
+    try:
+        found = S('a1:c2').find(predicate)
+        assert calls == []
+        assert found.next() == S('a1')
+        assert len(calls) == 2 # only the first block
+    finally:
+        S.block_cells = original
+
+    assert [ cell for cell in S('a1:c2').find(True) ] == [ S('a1'), S('a2'), S('b2'), S('c1'), S('c2') ]
+
 def test_each():
     S('a1:a10').each(lambda cell: cell.set_string('%s-' % str(cell)))
 
@@ -849,6 +1345,279 @@ def test_each():
     assert S('a2').string.endswith('.A2-')
     assert S('a10').string.endswith('.A10-')
 
+def test_apply():
+    S('a1:b3').data_array = ((1, 2), (3, 4), ('a', ''))
+
+    result = S('a1:b3').apply(lambda data: data * 2)
+    assert result == S('a1:b3')
+    assert S('a1:b3').data_array == ((2, 4), (6, 8), (u'aa', u''))
+
+    S('a1:b2').apply(lambda data: None if data == 2 else data)
+    assert S('a1').string == ''
+    assert S('b2').value == 8
+
+def test_apply_by_row_and_column():
+    S('a1:b2').data_array = ((1, 2), (3, 4))
+
+    S('a1:b2').apply(lambda row: (row[0] + row[1], row[1]), by = 'row')
+    assert S('a1:b2').data_array == ((3, 2), (7, 4))
+
+    S('a1:b2').apply(lambda column: [ value / sum(column) for value in column ], by = 'column')
+    assert S('a1:b2').data_array == ((0.3, 1.0 / 3), (0.7, 2.0 / 3))
+
+    try:
+        S('a1:b2').apply(lambda row: row[:1], by = 'row')
+        assert False
+    except AssertionError:
+        pass
+
+    try:
+        S('a1:b2').apply(lambda column: column + (0,), by = 'column')
+        raised = False
+    except AssertionError:
+        raised = True
+    assert raised
+    assert S('a3').string == ''
+
+def test_snapshot_commits_only_changes():
+    S('a1:d4').data_array = [ [ row * 4 + col for col in range(4) ] for row in range(4) ]
+
+    snapshot = S('a1:d4').snapshot()
+    assert snapshot[2][1] == 9
+    assert snapshot[2, 1] == 9
+    assert snapshot.commit() == 0
+
+    snapshot[0, 0] = 'changed'
+    snapshot[0][1] = 'changed'
+    snapshot[1, 0] = 100
+    snapshot[1, 1] = 101
+    snapshot[3, 3] = None
+    snapshot[2, 2] = 10 # same value
+
+    assert S('a1').value == 0
+    assert snapshot.changes == [(0, 0), (0, 1), (1, 0), (1, 1), (3, 3)]
+    assert snapshot.commit() == 2
+    assert snapshot.commit() == 0
+
+    assert S('a1:d4').data_array == ((u'changed', u'changed', 2, 3),
+                                     (100, 101, 6, 7),
+                                     (8, 9, 10, 11),
+                                     (12, 13, 14, u''))
+
+def test_snapshot_as_context_manager():
+    S('b2:c3').value = 1
+
+    with S('b2:c3').snapshot() as snapshot:
+        snapshot[1] = (2, 3)
+
+    assert S('b3').value == 2
+    assert S('c3').value == 3
+
+    try:
+        with S('b2:c3').snapshot() as snapshot:
+            snapshot[0, 0] = 5
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert S('b2').value == 1
+
+def test_aggregates():
+    S('a1:a4').data_array = ((1,), (2,), (3,), (6,))
+    S('b1').string = 'hello'
+
+    assert S('a1:a4').sum() == 12
+    assert S('a1:b4').count() == 5
+    assert S('a1:b4').count_numbers() == 4
+    assert S('a1:b4').average() == 3
+    assert S('a1:b4').max() == 6
+    assert S('a1:b4').min() == 1
+    assert S('a1:a2').compute('product') == 2
+
+def test_sort():
+    S('a1:b5').data_array = (('name', 'age'),
+                             ('john', 30),
+                             ('mary', 25),
+                             ('anna', 30),
+                             ('bob', 40))
+
+    assert S('a1:b5').sort(has_header = True).selector == 'Sheet1.A1:B5'
+    assert S('a2:a5').data_array == (('anna',), ('bob',), ('john',), ('mary',))
+
+    S('a1:b5').sort(by = [('B', True), 'A'], has_header = True)
+    assert S('a1:a5').data_array == (('name',), ('bob',), ('anna',), ('john',), ('mary',))
+
+def test_filter():
+    S('a1:b5').data_array = (('name', 'age'),
+                             ('john', 30),
+                             ('mary', 25),
+                             ('anna', 30),
+                             ('bob', 40))
+    rows = S().sheet.getRows()
+    visible = lambda: [ rows.getByIndex(i).IsVisible for i in range(5) ]
+
+    S('a1:b5').filter([('B', '>=', 30)])
+    assert visible() == [True, True, False, True, True]
+
+    S('a1:b5').filter([('B', '==', 30), ('A', '==', 'mary')], connection = 'or')
+    assert visible() == [True, True, True, True, False]
+
+    S('a1:b5').unfilter()
+    assert visible() == [True] * 5
+
+def test_group_by():
+    S('a1:c6').data_array = (('name', 'age', 'sales'),
+                             ('john', 30, 10),
+                             ('mary', 25, 20),
+                             ('john', 30, 5),
+                             ('anna', 40, 7),
+                             ('mary', 25, 1))
+
+    result = S('a1:c6').group_by(['A'], [('C', 'sum')], 'Sheet2.a1')
+    assert result.sheet.Name == 'Sheet2'
+    assert result.height == 4
+    assert result.data_array[1:] == (('anna', 7), ('john', 15), ('mary', 21))
+
+    result = S('a1:c6').group_by(['A', 'B'], [('C', 'count')], 'Sheet2.f1', totals = True)
+    assert result.data_array[-1][-1] == 5
+
+    try:
+        S('a1:c6').group_by(['A'], [('a', 'count')], 'Sheet2.k1')
+        raised = False
+    except AssertionError:
+        raised = True
+    assert raised
+
+    result = S('a1:c6').group_by(['A'], [('C', 'count')], 'Sheet2.k1')
+    assert result.data_array[1:] == (('anna', 1), ('john', 2), ('mary', 2))
+
+    tables = S('Sheet2.a1').sheet.getDataPilotTables()
+    for name in tables.getElementNames():
+        tables.removeByName(name)
+    S('Sheet2.a1:z100').delete()
+
+def test_bulk_edit():
+    model = S().model
+    with S().bulk():
+        assert not model.isAutomaticCalculationEnabled()
+        assert model.hasControllersLocked()
+        S('a1').value = 2
+        S('a2').formula = '=a1*2'
+        S('a1').value = 3
+
+    assert S('a2').value == 6
+    assert model.isAutomaticCalculationEnabled()
+    assert not model.hasControllersLocked()
+
+    model.getUndoManager().undo()
+    assert S('a1').value == 0
+    assert S('a2').formula == ''
+
+def test_bulk_edit_is_restored_after_exceptions():
+    model = S().model
+    try:
+        with S().bulk(undo = False):
+            S('a1').value = 1
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert model.isAutomaticCalculationEnabled()
+    assert not model.hasControllersLocked()
+    assert not model.getUndoManager().isLocked()
+    assert S('a1').value == 1
+
+def test_bulk_edit_is_restored_when_it_cannot_start():
+    from oosheet import OOBulkEdit
+
+    class BrokenUndo(object):
+        def __init__(self, model):
+            self.model = model
+        def getUndoManager(self):
+            raise AttributeError('getUndoManager')
+        def __getattr__(self, name):
+            return getattr(self.model, name)
+
+    model = S().model
+    try:
+        with OOBulkEdit(BrokenUndo(model)):
+            assert False, "Should not get here"
+    except AttributeError:
+        pass
+
+    assert model.isAutomaticCalculationEnabled()
+    assert not model.hasControllersLocked()
+
+def test_cell_cache():
+    S('a1:a10').value = 3
+    S('b1').string = 'hello'
+
+    cache = S().enable_cache().cell_cache
+    try:
+        assert S('a1').value == 3
+        assert cache.misses == 1
+        assert S('a2').value == 3
+        assert S('a10').formula == '3'
+        assert S('b1').string == 'hello'
+        assert S('a1:a3').data_array == ((3,), (3,), (3,))
+        assert cache.hits == 2
+        assert cache.misses == 3
+
+        assert S('a2').string == '3'
+        assert S('a2').string == '3'
+        assert cache.hits == 3
+
+        S('a2').value = 5
+        assert S('a2').value == 5
+        S('a1:a3').string = 'x'
+        assert S('a3').string == 'x'
+        S('a1:b2').data_array = ((1, 2), (3, 4))
+        assert S('b2').value == 4
+        S('a1').formula = '=b2*2'
+        assert S('a1').value == 8
+        S('b2').value = 5
+        assert S('a1').value == 10
+
+        S('a1').delete()
+        assert S('a1').formula == ''
+        S('a4').insert_row()
+        assert S('a5').value == 3
+        assert S('a4').value == 0
+    finally:
+        S().disable_cache()
+
+    assert S().cell_cache is None
+
+def test_change_feed():
+    feed = S().watch_changes()
+    try:
+        assert S().watch_changes() is feed
+        feed.take()
+
+        # simulates user typing in cell
+        S('b2').focus()
+        S().dispatch('EnterString', ('StringName', 'typed'))
+
+        changes = feed.take()
+        assert ('cell-change', S('b2')) in changes
+        assert feed.take() == []
+    finally:
+        S().unwatch_changes()
+
+def test_change_feed_forgets_sheets_on_sheet_changes():
+    from oosheet import OODoc
+
+    feed = S().watch_changes()
+    try:
+        S('Sheet2.a1')
+        feed.record('cell-change')
+        assert 'Sheet2' in OODoc._sheets
+
+        feed.record('rename-table')
+        assert 'Sheet2' not in OODoc._sheets
+    finally:
+        S().unwatch_changes()
+
 def test_indexing():
     assert S('b2:g10')[0][0] == S('B2')
     assert S('b2:g10')[1][0] == S('B3')